@@ -2,12 +2,52 @@
 import discord
 from discord.ext import commands
 from discord.ui import View, Button, Modal, TextInput
-import time
+import time, heapq, logging
+
+log = logging.getLogger(__name__)
 
-blocked_channels = {}  # {channel_id: unblock_timestamp}
 BLOCK_DURATION = 24*60*60  # 24 часа
 
-def setup(bot: commands.Bot, channels_data):
+class ChannelBlocks:
+    """Блокировки каналов: {channel_id (int): время разблокировки}
+
+    Проверка идёт на каждый клик и команду — это один взгляд на вершину кучи сроков
+    и поиск int в словаре. Истёкшие блокировки снимаются при извлечении из кучи.
+    """
+
+    def __init__(self):
+        self.until = {}
+        self.heap = []  # [(срок, channel_id)], устаревшие записи отбрасываются лениво
+
+    def block(self, channel_id, until):
+        self.until[channel_id] = until
+        heapq.heappush(self.heap, (until, channel_id))
+
+    def unblock(self, channel_id):
+        return self.until.pop(channel_id, None) is not None
+
+    def _expire(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            until, channel_id = heapq.heappop(self.heap)
+            if self.until.get(channel_id) == until:
+                del self.until[channel_id]
+
+    def is_blocked(self, channel_id):
+        if self.heap:
+            self._expire(time.time())
+        return channel_id in self.until
+
+    def load(self, data):
+        """Из хранилища или файла передачи; в JSON ключи — строки"""
+        self.until.clear()
+        self.heap.clear()
+        for channel_id, until in data.items():
+            self.block(int(channel_id), until)
+        self._expire(time.time())
+
+blocked_channels = ChannelBlocks()
+
+def setup(bot: commands.Bot, channels_data, save_blocks=lambda: None):
     @bot.command()
     @commands.is_owner()
     async def admin(ctx):
@@ -50,11 +90,14 @@ def setup(bot: commands.Bot, channels_data):
 
                         ch_id = channels_data[num-1]
                         if block:
-                            blocked_channels[str(ch_id)] = time.time() + BLOCK_DURATION
+                            blocked_channels.block(ch_id, time.time() + BLOCK_DURATION)
+                            save_blocks()
+                            log.info(f"⛔ Канал {ch_id} заблокирован на 24 часа", extra={"channel_id": ch_id, "by": modal_interaction.user.id})
                             await modal_interaction.response.send_message(f"⛔ Канал <#{ch_id}> заблокирован на 24 часа", ephemeral=True)
                         else:
-                            if str(ch_id) in blocked_channels:
-                                blocked_channels.pop(str(ch_id))
+                            if blocked_channels.unblock(ch_id):
+                                save_blocks()
+                                log.info(f"✅ Канал {ch_id} разблокирован", extra={"channel_id": ch_id, "by": modal_interaction.user.id})
                                 await modal_interaction.response.send_message(f"✅ Канал <#{ch_id}> разблокирован", ephemeral=True)
                             else:
                                 await modal_interaction.response.send_message("❌ Канал не был заблокирован", ephemeral=True)
@@ -64,7 +107,7 @@ def setup(bot: commands.Bot, channels_data):
         # выводим список каналов с их статусом
         desc = ""
         for i, ch_id in enumerate(channels_data, start=1):
-            status = "🔒 Заблокирован" if str(ch_id) in blocked_channels and time.time() < blocked_channels[str(ch_id)] else "✅ Доступен"
+            status = "🔒 Заблокирован" if blocked_channels.is_blocked(ch_id) else "✅ Доступен"
             desc += f"{i}. <#{ch_id}> — {status}\n"
 
         embed = discord.Embed(title="Админ-панель", description=desc, color=discord.Color.blurple())
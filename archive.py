@@ -0,0 +1,120 @@
+# archive.py
+import gzip, json, os, time
+from collections import Counter
+from storage import atomic_write, dump_json, load_json, plain, stats
+
+class RaidArchive:
+    """Архив завершённых рейдов: gzip-сегмент на неделю + маленький индекс
+
+    Завершённый рейд уходит из живого хранилища сюда. Сегменты только дописываются:
+    каждая пачка — отдельный gzip-member, а gzip.open читает их подряд как один файл.
+    Индекс (index.json) помнит по сегменту число рейдов, время первого и последнего
+    и серверы — статистика открывает только нужные недели и идёт по строкам, не
+    поднимая архив в память. Запись и чтение — в потоке PersistenceWorker.
+    """
+
+    def __init__(self, directory="archive"):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.index = {}    # сегмент -> {"count", "first", "last", "guilds"}
+        self.pending = {}  # сегмент -> [(строка JSON, archived_at, guild_id)]
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = load_json(self.index_path, {})
+        for name in os.listdir(self.directory):
+            if name.endswith(".jsonl.gz") and name not in self.index:
+                self.index[name] = self._scan(name)  # индекс не успел записаться
+        return self
+
+    def _path(self, segment):
+        return os.path.join(self.directory, segment)
+
+    @staticmethod
+    def segment_for(ts):
+        return time.strftime("raids-%G-W%V.jsonl.gz", time.gmtime(ts))
+
+    def add(self, raid_id, raid, archived_at=None):
+        """Сериализуем сейчас — рейд сразу после этого удаляется из памяти"""
+        archived_at = archived_at or time.time()
+        record = dict(plain(raid), id=raid_id, archived_at=archived_at)
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self.pending.setdefault(self.segment_for(archived_at), []).append((line, archived_at, record.get("guild_id")))
+
+    @staticmethod
+    def _note(entry, archived_at, guild_id):
+        entry["count"] += 1
+        entry["first"] = archived_at if entry["first"] is None else min(entry["first"], archived_at)
+        entry["last"] = archived_at if entry["last"] is None else max(entry["last"], archived_at)
+        if guild_id not in entry["guilds"]:
+            entry["guilds"].append(guild_id)
+
+    def flush_job(self):
+        if not self.pending:
+            return None
+        pending, self.pending = self.pending, {}
+
+        def job():
+            for segment, records in pending.items():
+                data = gzip.compress("".join(line for line, _, _ in records).encode("utf-8"))
+                with open(self._path(segment), "ab") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                stats["bytes_written"] += len(data)
+                stats["fsyncs"] += 1
+                entry = self.index.setdefault(segment, {"count": 0, "first": None, "last": None, "guilds": []})
+                for _, archived_at, guild_id in records:
+                    self._note(entry, archived_at, guild_id)
+            atomic_write(self.index_path, dump_json(self.index))
+        return job
+
+    # ================== ЧТЕНИЕ ==================
+    def _read(self, segment):
+        try:
+            with gzip.open(self._path(segment), "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (EOFError, OSError):
+            return  # недописанный хвост после падения — всё до него уже прочитано
+
+    def _scan(self, segment):
+        entry = {"count": 0, "first": None, "last": None, "guilds": []}
+        for rec in self._read(segment):
+            self._note(entry, rec.get("archived_at", 0), rec.get("guild_id"))
+        return entry
+
+    def records(self, guild_id=None, since=None):
+        """Рейды из архива по порядку недель; старые записи без guild_id подходят любому серверу"""
+        for segment in sorted(self.index):
+            entry = self.index[segment]
+            if since is not None and (entry["last"] or 0) < since:
+                continue
+            if guild_id is not None and guild_id not in entry["guilds"] and None not in entry["guilds"]:
+                continue
+            for rec in self._read(segment):
+                if since is not None and rec.get("archived_at", 0) < since:
+                    continue
+                if guild_id is not None and rec.get("guild_id") not in (guild_id, None):
+                    continue
+                yield rec
+
+    def attendance(self, guild_id=None, since=None, top=20):
+        """(число рейдов, [(участник, в скольких рейдах был)])"""
+        raids, counts = 0, Counter()
+        for rec in self.records(guild_id, since):
+            raids += 1
+            counts.update({slot["user"] for slot in rec.get("slots", []) if slot.get("user")})
+        return raids, counts.most_common(top)
+
+    def leaders(self, guild_id=None, since=None, top=20):
+        """(число рейдов, [(id РЛ, имя, сколько рейдов собрал)])"""
+        raids, counts, names = 0, Counter(), {}
+        for rec in self.records(guild_id, since):
+            raids += 1
+            counts[rec.get("author_id")] += 1
+            names[rec.get("author_id")] = rec.get("author_name")
+        return raids, [(author_id, names[author_id], n) for author_id, n in counts.most_common(top)]
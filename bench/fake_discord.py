@@ -0,0 +1,206 @@
+# bench/fake_discord.py
+# Локальная замена HTTP/шлюза Discord для нагрузочных прогонов bot.py без сети.
+import asyncio, itertools, logging, random, time
+from collections import deque
+import discord
+
+_ids = itertools.count(10**17)
+
+def next_id():
+    return next(_ids)
+
+class FakeHTTPResponse:
+    """То, что discord.HTTPException ждёт вместо aiohttp-ответа"""
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+
+class FakeRole:
+    def __init__(self, name):
+        self.id = next_id()
+        self.name = name
+
+class FakeUser:
+    def __init__(self, name, roles=(), user_id=None):
+        self.id = user_id or next_id()
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{self.id}>"
+        self.roles = [FakeRole(r) for r in roles]
+        self.bot = False
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeGateway:
+    """Общие настройки и счётчики «сервера»: задержка HTTP, лимит правок на канал"""
+
+    def __init__(self, latency=0.05, jitter=0.5, edit_limit=5, edit_period=5.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.edit_limit = edit_limit    # правок на канал за edit_period, дальше 429
+        self.edit_period = edit_period
+        self.channels = {}
+        self.bot_user = FakeUser("RaidBot")
+        self.counts = {"send": 0, "edit": 0, "delete": 0, "fetch": 0, "history": 0, "429": 0}
+        self.http_log = logging.getLogger("discord.http")
+
+    def add_channel(self, name):
+        channel = FakeChannel(self, name)
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def roundtrip(self):
+        await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def rate_limited(self, bucket):
+        """Как discord.py: на 429 ждём retry_after и повторяем, наружу ошибку не отдаём"""
+        while True:
+            now = time.monotonic()
+            while bucket and bucket[0] <= now - self.edit_period:
+                bucket.popleft()
+            if len(bucket) < self.edit_limit:
+                bucket.append(now)
+                return
+            retry_after = bucket[0] + self.edit_period - now
+            self.counts["429"] += 1
+            self.http_log.warning("We are being rate limited. PATCH fake responded with 429. Retrying in %.2f seconds.", retry_after)
+            await asyncio.sleep(retry_after)
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, view=None, author=None, message_id=None):
+        self.channel = channel
+        self.id = message_id or next_id()
+        self.content = content
+        self.embeds = [embed] if embed else []
+        self.author = author or channel.gateway.bot_user
+        self.guild = channel.guild
+        self.components = view.to_components() if view else []
+
+    async def edit(self, embed=discord.utils.MISSING, view=discord.utils.MISSING, **kwargs):
+        gateway = self.channel.gateway
+        await gateway.rate_limited(self.channel.edit_bucket)
+        await gateway.roundtrip()
+        stored = self.channel.messages.get(self.id)
+        if stored is None:
+            raise discord.NotFound(FakeHTTPResponse(404, "Not Found"), "Unknown Message")
+        if embed is not discord.utils.MISSING:
+            stored.embeds = [embed] if embed else []
+        if view is not discord.utils.MISSING:
+            stored.components = view.to_components() if view else []
+        gateway.counts["edit"] += 1
+        return stored
+
+    async def delete(self):
+        gateway = self.channel.gateway
+        await gateway.roundtrip()
+        if self.channel.messages.pop(self.id, None) is None:
+            raise discord.NotFound(FakeHTTPResponse(404, "Not Found"), "Unknown Message")
+        gateway.counts["delete"] += 1
+
+class FakeGuild:
+    def __init__(self):
+        self.id = next_id()
+        self.roles = []
+
+    def get_member(self, user_id):
+        return None
+
+class FakeChannel:
+    def __init__(self, gateway, name):
+        self.gateway = gateway
+        self.id = next_id()
+        self.name = name
+        self.guild = FakeGuild()
+        self.messages = {}
+        self.edit_bucket = deque()
+
+    async def send(self, content=None, embed=None, view=None, **kwargs):
+        await self.gateway.roundtrip()
+        msg = FakeMessage(self, content, embed, view)
+        self.messages[msg.id] = msg
+        self.gateway.counts["send"] += 1
+        return msg
+
+    def get_partial_message(self, message_id):
+        # как PartialMessage: без запроса, правки/удаление по id
+        return self.messages.get(message_id) or FakeMessage(self, message_id=message_id)
+
+    async def fetch_message(self, message_id):
+        await self.gateway.roundtrip()
+        self.gateway.counts["fetch"] += 1
+        msg = self.messages.get(message_id)
+        if msg is None:
+            raise discord.NotFound(FakeHTTPResponse(404, "Not Found"), "Unknown Message")
+        return msg
+
+    async def history(self, limit=50):
+        self.gateway.counts["history"] += 1
+        await self.gateway.roundtrip()
+        for msg in sorted(self.messages.values(), key=lambda m: m.id, reverse=True)[:limit]:
+            yield msg
+
+class FakeResponse:
+    """interaction.response: запоминаем момент первого ответа и открытую модалку"""
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.responded_at = None
+        self.modal = None
+        self.messages = []
+
+    def _done(self):
+        if self.responded_at is None:
+            self.responded_at = time.perf_counter()
+
+    async def send_message(self, content=None, ephemeral=False, **kwargs):
+        await self.interaction.channel.gateway.roundtrip()
+        self._done()
+        self.messages.append(content)
+
+    async def edit_message(self, content=None, **kwargs):
+        await self.interaction.channel.gateway.roundtrip()
+        self._done()
+        self.messages.append(content)
+
+    async def send_modal(self, modal):
+        await self.interaction.channel.gateway.roundtrip()
+        self._done()
+        self.modal = modal
+
+    def is_done(self):
+        return self.responded_at is not None
+
+class FakeInteraction:
+    def __init__(self, channel, user, custom_id=None, message=None, values=None):
+        self.id = next_id()
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild = channel.guild
+        self.user = user
+        self.message = message
+        self.data = {"custom_id": custom_id} if custom_id else {"custom_id": "modal"}
+        if values is not None:
+            self.data["values"] = values  # выбор в select-меню
+        self.response = FakeResponse(self)
+        self.created = time.perf_counter()
+
+    @property
+    def latency(self):
+        """Сколько прошло от прихода взаимодействия до ответа Discord"""
+        if self.response.responded_at is None:
+            return None
+        return self.response.responded_at - self.created
+
+def fill_modal(modal, *values):
+    """Заполняем TextInput модалки по порядку, как это сделал бы клиент Discord"""
+    inputs = [item for item in modal.children if isinstance(item, discord.ui.TextInput)]
+    for item, value in zip(inputs, values):
+        item._value = value
+    return modal
@@ -0,0 +1,153 @@
+# bench/gateway_memory.py
+# Память bot.py на синтетическом большом сервере: обычный режим против LEAN_MODE=1.
+#   python bench/gateway_memory.py --members 50000 --channels 50 --messages 5000
+# Каждый режим — отдельный процесс: импортируем bot.py с его настройками кэшей и
+# скармливаем состоянию discord.py события шлюза (GUILD_CREATE, пачки участников,
+# MESSAGE_CREATE) без сети. Печатает прирост памяти (tracemalloc) и RSS.
+import argparse, asyncio, gc, json, os, subprocess, sys, tempfile, time, tracemalloc
+from discord.state import ChunkRequest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 1000  # участников в одном GUILD_MEMBERS_CHUNK, как у Discord
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Память бота на большом сервере: default против lean")
+    parser.add_argument("--members", type=int, default=50000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--roles", type=int, default=30)
+    parser.add_argument("--messages", type=int, default=5000, help="сообщений в каналах после старта")
+    parser.add_argument("--child", choices=["default", "lean"], help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def iso(ts):
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(ts))
+
+def user(uid):
+    return {"id": str(uid), "username": f"user{uid}", "discriminator": "0", "global_name": f"Игрок {uid}", "avatar": None}
+
+def member(uid, role_ids):
+    return {"user": user(uid), "roles": role_ids, "nick": None, "joined_at": iso(1.6e9),
+            "deaf": False, "mute": False, "flags": 0}
+
+def guild_payload(args, guild_id):
+    roles = [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+              "hoist": False, "managed": False, "mentionable": False}]
+    roles += [{"id": str(guild_id + 1 + i), "name": "РЛ" if i == 0 else f"Роль {i}", "permissions": "0",
+               "position": i + 1, "color": 0, "hoist": False, "managed": False, "mentionable": False}
+              for i in range(args.roles)]
+    channels = [{"id": str(guild_id + 1000 + i), "type": 0, "name": f"raids-{i}", "position": i,
+                 "permission_overwrites": [], "guild_id": str(guild_id)} for i in range(args.channels)]
+    return {
+        "id": str(guild_id), "name": "Большой сервер", "owner_id": "1", "large": True,
+        "member_count": args.members, "roles": roles, "channels": channels, "members": [],
+        "presences": [], "voice_states": [], "threads": [], "emojis": [], "stickers": [],
+        "features": [], "stage_instances": [], "guild_scheduled_events": [],
+    }
+
+def member_chunks(args, guild_id, nonce):
+    role_ids = [str(guild_id + 1 + i) for i in range(args.roles)]
+    count = (args.members + CHUNK - 1) // CHUNK
+    for index in range(count):
+        start = index * CHUNK
+        yield {
+            "guild_id": str(guild_id), "chunk_index": index, "chunk_count": count, "nonce": nonce,
+            "members": [member(10**6 + uid, role_ids[uid % 3: uid % 3 + 2])
+                        for uid in range(start, min(start + CHUNK, args.members))],
+        }
+
+def message_payload(args, guild_id, i):
+    uid = 10**6 + i % args.members
+    return {
+        "id": str(10**9 + i), "channel_id": str(guild_id + 1000 + i % args.channels), "guild_id": str(guild_id),
+        "author": user(uid), "member": {"roles": [], "joined_at": iso(1.6e9), "deaf": False, "mute": False},
+        "content": f"сообщение {i} " + "x" * 100, "timestamp": iso(time.time()), "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+        "embeds": [], "pinned": False, "type": 0,
+    }
+
+def rss_mb():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+async def child(args):
+    sys.path.insert(0, ROOT)
+    bot_module = __import__("bot")
+    # без login() у клиента нет цикла событий, а dispatch() его читает
+    await bot_module.bot._async_setup_hook()
+    state = bot_module.bot._connection
+    # без сети не можем запросить участников у шлюза — пачки подаём сами, если режим их просит
+    wants_members = state._chunk_guilds and bot_module.intents.members
+    state._chunk_guilds = False
+    guild_id = 10**12
+
+    gc.collect()
+    tracemalloc.start()
+    base_rss = rss_mb()
+    started = time.perf_counter()
+
+    state.parse_guild_create(guild_payload(args, guild_id))
+    if wants_members:
+        # как chunk_guild(): пачки без ожидающего запроса discord.py отбрасывает, в кэш
+        # гильдии их кладёт только ChunkRequest с cache=True
+        request = ChunkRequest(guild_id, 0, bot_module.bot.loop, state._get_guild,
+                               cache=state.member_cache_flags.joined)
+        state._chunk_requests[guild_id] = request
+        for chunk in member_chunks(args, guild_id, request.nonce):
+            state.parse_guild_members_chunk(chunk)
+        request.buffer.clear()  # ответ запроса нам не нужен — считаем только кэш гильдии
+    for i in range(args.messages):
+        state.parse_message_create(message_payload(args, guild_id, i))
+    await asyncio.sleep(0)  # даём отработать запланированным обработчикам событий
+
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    guild = state._get_guild(guild_id)
+    result = {
+        "mode": args.child,
+        "seconds": time.perf_counter() - started,
+        "traced_mb": current / (1024 * 1024),
+        "peak_mb": peak / (1024 * 1024),
+        "rss_mb": None if base_rss is None else rss_mb() - base_rss,
+        "members": len(guild.members) if guild else 0,
+        "messages": len(state._messages) if state._messages is not None else 0,
+    }
+    if wants_members:
+        assert result["members"] == args.members, f"в кэше {result['members']} участников из {args.members}"
+    print(json.dumps(result))
+    await bot_module.writer.close()
+    bot_module.store.close()
+
+def run_child(mode, argv):
+    env = dict(os.environ, LEAN_MODE="1" if mode == "lean" else "0", METRICS_PORT="0",
+               TOKEN=os.environ.get("TOKEN", "bench"), HANDOFF_FILE="")
+    workdir = tempfile.mkdtemp(prefix=f"raid-mem-{mode}-")  # bot.py пишет файлы в текущий каталог
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--child", mode],
+                         cwd=workdir, env=env, capture_output=True, text=True)
+    for line in reversed(out.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"прогон {mode} упал:\n{out.stderr}")
+
+def main():
+    args = parse_args()
+    if args.child:
+        asyncio.run(child(args))
+        return
+
+    argv = [f"--members={args.members}", f"--channels={args.channels}",
+            f"--roles={args.roles}", f"--messages={args.messages}"]
+    results = [run_child(mode, argv) for mode in ("default", "lean")]
+    print(f"участников {args.members}, каналов {args.channels}, ролей {args.roles}, сообщений {args.messages}")
+    for r in results:
+        rss = "—" if r["rss_mb"] is None else f"{r['rss_mb']:.1f}"
+        print(f"  {r['mode']:8} память {r['traced_mb']:7.1f} МБ (пик {r['peak_mb']:7.1f})  RSS +{rss} МБ  "
+              f"в кэше: участников {r['members']}, сообщений {r['messages']}  за {r['seconds']:.2f} с")
+    default, lean = results
+    if lean["traced_mb"]:
+        print(f"lean меньше в {default['traced_mb'] / lean['traced_mb']:.1f} раза")
+
+if __name__ == "__main__":
+    main()
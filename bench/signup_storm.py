@@ -0,0 +1,162 @@
+# bench/signup_storm.py
+# Нагрузочный прогон bot.py на фейковом Discord (см. fake_discord.py):
+#   python bench/signup_storm.py --raids 50 --channels 10 --users 500
+# Печатает p50/p99 задержки ответа на взаимодействия, число правок/429,
+# сколько байт записано на диск и пиковую память.
+import argparse, asyncio, os, random, statistics, sys, tempfile, time, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ROLES = ["Танк", "Хил", "ДД", "ДД", "ДД", "Порезка"]
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Шторм записей на рейды против фейкового Discord")
+    parser.add_argument("--raids", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--slots", type=int, default=12, help="слотов в рейде")
+    parser.add_argument("--burst", type=float, default=2.0, help="за сколько секунд приходят все клики")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка фейкового HTTP, с")
+    parser.add_argument("--edit-limit", type=int, default=5, help="правок на канал за 5 с до 429")
+    parser.add_argument("--expired", type=int, default=0, help="сколько просроченных рейдов завершить после шторма")
+    parser.add_argument("--storage", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+class Storm:
+    def __init__(self, args, bot_module, gateway):
+        self.args = args
+        self.bot = bot_module
+        self.gateway = gateway
+        self.latencies = {"create_raid": [], "pick": []}
+        self.outcomes = {}
+
+    def record(self, kind, interaction):
+        if interaction.latency is not None:
+            self.latencies[kind].append(interaction.latency)
+
+    async def create_raid(self, channel, admin):
+        from fake_discord import FakeInteraction, fill_modal
+        inter = FakeInteraction(channel, admin, "create_raid")
+        await self.bot.on_interaction(inter)
+        self.record("create_raid", inter)
+        roles = "\n".join(random.choice(ROLES) for _ in range(self.args.slots))
+        submit = FakeInteraction(channel, admin)
+        modal = fill_modal(inter.response.modal, "Рейд", "Описание", "20:00 МСК", roles)
+        await modal.on_submit(submit)
+
+    async def signup(self, user, raid_id, delay):
+        from fake_discord import FakeInteraction
+        await asyncio.sleep(delay)
+        raid = self.bot.raids.get(raid_id)
+        channel = self.gateway.get_channel(raid.channel_id)
+        # пользователь выбирает случайный слот из меню свободных под рейдом
+        free = [i + 1 for i in self.bot.slot_book.free_slots(raid_id, raid)] or [1]
+        inter = FakeInteraction(channel, user, f"pick_{raid_id}", values=[str(random.choice(free))])
+        await self.bot.on_interaction(inter)
+        self.record("pick", inter)
+        text = inter.response.messages[-1] if inter.response.messages else "без ответа"
+        key = "✅ записан" if text.startswith("✅") else text
+        self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    async def expire(self):
+        """Завершение пачки просроченных рейдов, как после простоя бота"""
+        now = time.time()
+        ids = list(self.bot.raids)[: self.args.expired]
+        start = time.perf_counter()
+        for raid_id in ids:
+            self.bot.raids[raid_id].created_at = now - self.bot.RAID_EXPIRE - 1
+            self.bot.expiry.schedule(raid_id, self.bot.raid_deadline(self.bot.raids[raid_id]))
+        while any(raid_id in self.bot.raids for raid_id in ids):
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - start
+
+def sqlite_size(path):
+    """База + WAL на диске: SQLite пишет страницами мимо storage.stats"""
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+async def run(args):
+    from fake_discord import FakeGateway, FakeUser
+    import storage
+    bot_module = __import__("bot")
+
+    gateway = FakeGateway(latency=args.latency, edit_limit=args.edit_limit)
+    bot = bot_module.bot
+    bot.get_channel = gateway.get_channel
+    bot._connection.user = gateway.bot_user
+
+    async def ready():
+        return None
+    bot.wait_until_ready = ready
+    bot_module.WARMUP_DELAY = 0  # в прогоне нечего ждать
+    await bot.setup_hook()
+
+    channels = [gateway.add_channel(f"raids-{i}") for i in range(args.channels)]
+    admin = FakeUser("admin", user_id=bot_module.ADMIN_ID)
+    storm = Storm(args, bot_module, gateway)
+
+    sqlite_before = 0
+    if args.storage == "sqlite":
+        # без автосброса WAL только растёт — его прирост и есть всё записанное за прогон
+        bot_module.store.conn.execute("PRAGMA wal_autocheckpoint=0")
+        sqlite_before = sqlite_size(bot_module.DB_FILE)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(storm.create_raid(channels[i % len(channels)], admin) for i in range(args.raids)))
+    raid_ids = list(bot_module.raids)
+
+    users = [FakeUser(f"user{i}") for i in range(args.users)]
+    await asyncio.gather(*(
+        storm.signup(user, random.choice(raid_ids), random.uniform(0, args.burst)) for user in users
+    ))
+    await bot_module.raid_edits.flush()
+    await bot_module.writer.flush()
+    storm_time = time.perf_counter() - started
+
+    expire_time = await storm.expire() if args.expired else None
+    await bot_module.writer.flush()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"рейдов {args.raids}, каналов {args.channels}, пользователей {args.users}, хранилище {args.storage}")
+    print(f"шторм занял {storm_time:.2f} с")
+    for kind, values in storm.latencies.items():
+        if values:
+            print(f"  {kind:14} n={len(values):5}  p50={percentile(values, 0.5)*1000:7.1f} мс  "
+                  f"p99={percentile(values, 0.99)*1000:7.1f} мс  mean={statistics.mean(values)*1000:7.1f} мс")
+    print("исходы записи:", ", ".join(f"{k}: {v}" for k, v in sorted(storm.outcomes.items())))
+    print(f"HTTP: отправлено {gateway.counts['send']}, правок {gateway.counts['edit']}, удалено {gateway.counts['delete']}, "
+          f"fetch {gateway.counts['fetch']}, history {gateway.counts['history']}, 429 {gateway.counts['429']}")
+    written = storage.stats["bytes_written"]
+    if args.storage == "sqlite":
+        written += sqlite_size(bot_module.DB_FILE) - sqlite_before
+    print(f"диск: {written} байт, fsync {storage.stats['fsyncs']}")
+    if expire_time is not None:
+        print(f"завершение {args.expired} просроченных рейдов: {expire_time:.2f} с")
+    print(f"пиковая память (tracemalloc): {peak / (1024 * 1024):.1f} МБ")
+
+    await bot_module.writer.close()
+    bot_module.store.close()
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="raid-bench-")
+    os.chdir(workdir)  # bot.py читает и пишет файлы в текущем каталоге
+    os.environ.setdefault("TOKEN", "bench")
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["STORAGE_BACKEND"] = args.storage
+    asyncio.run(run(args))
+    print(f"файлы прогона: {workdir}")
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,238 @@
 import discord
 from discord.ext import commands, tasks
-from discord.ui import Button, View, Modal, TextInput
-import json, os, time, asyncio, shutil
+from discord.ui import Button, View, Modal, TextInput, Select
+import os, time, asyncio, shutil, signal, logging
+from functools import partial
 from dotenv import load_dotenv
-import traceback
 from admin import setup as setup_admin, blocked_channels  # импортируем блокировки
+import metrics
+from logs import setup_logging
+from metrics import timed
+from storage import save_json, open_backend, PersistenceWorker, stats as storage_stats
+from edits import EditScheduler
+from expiry import ExpiryScheduler
+from render import RaidRenderer
+from panels import PanelManager
+from handoff import dump_state, load_state
+from archive import RaidArchive
+from permissions import PermissionResolver, CREATE_RAID
+from raid_model import Raid, Slot, NameCache, SlotBook, CLAIMED, SLOT_TAKEN, ALREADY_SIGNED
 
 # ================== НАСТРОЙКИ ==================
 load_dotenv()
 TOKEN = os.getenv("TOKEN")
-if not TOKEN:
-    print("❌ TOKEN не найден")
-    exit(1)
 
 ADMIN_ID = 1030933788005502996
 RL_ROLE_NAME = "РЛ"
 DATA_FILE = "raids.json"
 CHANNEL_FILE = "channel.json"
+PANEL_FILE = "panels.json"
+BLOCK_FILE = "blocks.json"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")  # json | sqlite
+DB_FILE = os.getenv("DB_FILE", "bot.db")
+HANDOFF_FILE = os.getenv("HANDOFF_FILE", "state.handoff")  # пусто — без быстрого перезапуска
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")  # завершённые рейды по неделям
+WARMUP_DELAY = 30       # панели и завершение рейдов — только после старта кнопок
+PANEL_TITLE = "🎯 Создание рейда"
 
 UPDATE_INTERVAL = 600   # обновление панели каждые 10 минут
 RAID_EXPIRE = 43200     # 12 часов
-
-intents = discord.Intents.default()
-intents.message_content = True
-intents.guilds = True
-intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-# ================== JSON УТИЛИТЫ ==================
-def load_json(path, default):
-    if not os.path.exists(path):
-        return default
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return default
-
-def save_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 — не поднимать /metrics
+# Экономный режим: без списка участников серверов и без кэша сообщений — роли и имя
+# нажавшего приходят с каждым взаимодействием, удаление панели ловим сырым событием
+LEAN_MODE = os.getenv("LEAN_MODE", "0") == "1"
+
+# Шарды: SHARD_COUNT — всего шардов (0 — обычный бот), SHARD_IDS — шарды этого
+# процесса через запятую (пусто — все). Процессы делят одну SQLite-базу.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(x) for x in os.getenv("SHARD_IDS", "").split(",") if x.strip()] or None
+if SHARD_COUNT and SHARD_IDS:
+    ARCHIVE_DIR = f"{ARCHIVE_DIR}.{'-'.join(map(str, SHARD_IDS))}"  # сервер живёт в одном шарде
+if SHARD_COUNT and SHARD_IDS and HANDOFF_FILE:
+    HANDOFF_FILE = f"{HANDOFF_FILE}.{'-'.join(map(str, SHARD_IDS))}"  # у каждого воркера свой
+
+# ================== ЛОГИ ==================
+# JSON-строки с ротацией и сжатием, запись в фоновом потоке (см. logs.py)
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+if SHARD_COUNT and SHARD_IDS:
+    LOG_FILE = f"{LOG_FILE}.{'-'.join(map(str, SHARD_IDS))}"  # ротация файла — только из одного процесса
+setup_logging(LOG_FILE)
+log = logging.getLogger("raidbot")
+
+# ================== МЕТРИКИ ==================
+m_interactions = metrics.counter("raidbot_interactions_total", "Нажатия кнопок по действиям", ["action"])
+m_handler = metrics.histogram("raidbot_handler_seconds", "Время обработчиков взаимодействий", ["handler"])
+m_edits = metrics.counter("raidbot_message_edits_total", "Правки сообщений", ["kind"])
+m_edit_seconds = metrics.histogram("raidbot_message_edit_seconds", "Время правки сообщения", ["kind"])
+m_history_scans = metrics.counter("raidbot_history_scans_total", "Проходы по channel.history", ["where"])
+m_loop = metrics.histogram("raidbot_loop_seconds", "Время одного прохода фоновых циклов", ["loop"])
+m_storage_flush = metrics.histogram("raidbot_storage_flush_seconds", "Время записи пачки изменений на диск")
+m_rate_limits = metrics.counter("raidbot_rate_limits_total", "Ответы 429 от Discord")
+metrics.count_rate_limits(m_rate_limits)
+metrics.gauge("raidbot_raids", "Активные рейды", lambda: len(raids))
+metrics.gauge("raidbot_channels", "Каналы с панелью", lambda: len(channels_data))
+metrics.gauge("raidbot_pending_edits", "Отложенные правки сообщений", lambda: len(raid_edits.tasks))
+metrics.gauge("raidbot_expiry_queue", "Рейды в очереди завершения", lambda: len(expiry.deadlines))
+metrics.gauge("raidbot_storage_bytes_written", "Байт записано на диск с запуска", lambda: storage_stats["bytes_written"])
+metrics.gauge("raidbot_storage_fsyncs", "fsync с запуска", lambda: storage_stats["fsyncs"])
+
+if LEAN_MODE:
+    intents = discord.Intents.none()
+    intents.guilds = True           # каналы и роли (нужны для прав и on_guild_role_*)
+    intents.guild_messages = True   # команды и on_raw_message_delete
+    intents.dm_messages = True
+    intents.message_content = True  # префиксные команды !createpanel, !admin
+    cache_options = {
+        "max_messages": None,        # кэш сообщений не нужен
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+    }
+else:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.guilds = True
+    intents.members = True
+    cache_options = {}
+
+def owns_shard(shard_id):
+    return not SHARD_COUNT or SHARD_IDS is None or shard_id in SHARD_IDS
+
+def owns_raid(raid):
+    """Рейд обслуживает воркер, которому принадлежит шард его сервера"""
+    if not SHARD_COUNT:
+        return True
+    if raid.guild_id is not None:
+        return owns_shard((raid.guild_id >> 22) % SHARD_COUNT)
+    # старые рейды без guild_id: видим канал — значит наш сервер (в кэше только свои шарды)
+    if bot.get_channel(raid.channel_id):
+        return True
+    return owns_shard(0)  # канал пропал — рейд-сироту завершает воркер шарда 0
+
+BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARD_COUNT else {}
+
+class RaidBot(BotBase):
+    async def setup_hook(self):
+        # runner.py останавливает бота через SIGTERM — закрываемся штатно, с записью данных
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass  # Windows
+        if METRICS_PORT:
+            metrics.start_http_server(port=METRICS_PORT)
+        writer.start()
+        for raid_id, raid in raids.items():
+            expiry.schedule(raid_id, raid_deadline(raid))
+        expiry.start(delay=WARMUP_DELAY)
+
+    async def close(self):
+        await raid_edits.flush()
+        await writer.close()  # сбрасываем несохранённое перед выходом
+        store.close()
+        if HANDOFF_FILE:
+            dump_state(HANDOFF_FILE, {
+                "raids": raids,
+                "channels": channels_data,
+                "panels": panel_index,
+                "blocks": dict(blocked_channels.until),
+            })
+        await super().close()
+
+bot = RaidBot(command_prefix="!", intents=intents, **cache_options, **shard_options)
 
 # ================== ЗАГРУЗКА ДАННЫХ ==================
-raids = load_json(DATA_FILE, {})
-channels_data = load_json(CHANNEL_FILE, [])
-if not isinstance(channels_data, list):
-    channels_data = []
+# по умолчанию JSON-файлы (рейды — снимок + журнал), либо SQLite (см. storage.py)
+store = open_backend(STORAGE_BACKEND, raids_path=DATA_FILE, channels_path=CHANNEL_FILE,
+                     panels_path=PANEL_FILE, blocks_path=BLOCK_FILE, db_path=DB_FILE)
+# после штатного перезапуска состояние берём из файла передачи (см. handoff.py)
+handoff = load_state(HANDOFF_FILE) if HANDOFF_FILE else None
+if handoff:
+    raids = handoff["raids"]
+    store.use_raids(raids)
+    channels_data = handoff["channels"]
+    panel_index = handoff["panels"]
+    blocked_channels.load(handoff["blocks"])
+    # SQLite сохраняет разницу с тем, что видел при загрузке — без этого удаления
+    # (снятая блокировка, убранная панель) не дойдут до базы
+    store.load_channels(); store.load_panels(); store.load_blocks()
+    log.info(f"⚡ Состояние принято от прошлого процесса: рейдов {len(raids)}")
+else:
+    raids = {k: Raid.from_dict(v) for k, v in store.load_raids(SHARD_COUNT, SHARD_IDS).items()}
+    if SHARD_COUNT:  # чужие рейды с известным сервером не держим в памяти
+        raids = {k: v for k, v in raids.items() if v.guild_id is None or owns_raid(v)}
+    store.use_raids(raids)  # словари из файла больше не держим
+    channels_data = store.load_channels()
+    panel_index = store.load_panels()  # {channel_id: id сообщения с панелью}
+    blocked_channels.load(store.load_blocks())
+
+archive = RaidArchive(ARCHIVE_DIR).load()  # см. archive.py
+
+slot_book = SlotBook()  # индексы и блокировки слотов по рейдам
+member_names = NameCache(maxsize=5000)  # id участника -> отображаемое имя
+
+# вся запись на диск идёт через фоновый поток, клики за 250 мс — одна запись
+writer = PersistenceWorker(window=0.25, observe=m_storage_flush.observe)
+
+def forget_raid(raid_id):
+    """Убираем рейд только из памяти этого процесса"""
+    raids.pop(raid_id, None)
+    slot_book.forget(raid_id)
+    expiry.cancel(raid_id)
+    renderer.forget(raid_id)
+
+def save_raid(raid_id, raid):
+    store.put_raid(raid_id, raid)
+    writer.mark_dirty("store", store.flush_job)
+
+def delete_raid(raid_id):
+    forget_raid(raid_id)
+    store.delete_raid(raid_id)
+    writer.mark_dirty("store", store.flush_job)
+
+def archive_raid(raid_id, raid):
+    archive.add(raid_id, raid)
+    writer.mark_dirty("archive", archive.flush_job)
+
+def save_channels():
+    store.save_channels(channels_data)
+    writer.mark_dirty("store", store.flush_job)
+
+def save_panels():
+    store.save_panels(panel_index)
+    writer.mark_dirty("store", store.flush_job)
+
+def save_blocks():
+    store.save_blocks(blocked_channels.until)
+    writer.mark_dirty("store", store.flush_job)
 
 # ================== ФУНКЦИЯ ПРОВЕРКИ БЛОКИРОВКИ ==================
 def is_channel_blocked(channel_id):
-    return str(channel_id) in blocked_channels and time.time() < blocked_channels[str(channel_id)]
+    return blocked_channels.is_blocked(channel_id)
+
+# ================== ПРАВА ==================
+# кто может создавать рейды — считается один раз и кэшируется (см. permissions.py)
+permissions = PermissionResolver(ADMIN_ID, RL_ROLE_NAME, ttl=300, maxsize=10000)
+
+@bot.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        permissions.forget_member(after.guild.id, after.id)
+
+@bot.event
+async def on_member_remove(member):
+    permissions.forget_member(member.guild.id, member.id)
+
+@bot.event
+async def on_guild_role_create(role):
+    permissions.forget_guild(role.guild.id)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    permissions.forget_guild(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    permissions.forget_guild(role.guild.id)
 
 # ================== UI ==================
 class CreateRaidPanel(View):
@@ -57,91 +240,208 @@ class CreateRaidPanel(View):
         super().__init__(timeout=None)
         self.add_item(Button(label="➕ Создать слот", style=discord.ButtonStyle.green, custom_id="create_raid"))
 
+PAGE_SIZE = 25  # больше вариантов в одном меню Discord не принимает
+
 class RaidSignupView(View):
-    def __init__(self, msg_id):
+    """Под рейдом: меню свободных слотов (запись в один клик) и отписка"""
+    def __init__(self, msg_id, options, free_count):
         super().__init__(timeout=None)
-        self.add_item(Button(label="✅ Записаться", style=discord.ButtonStyle.primary, custom_id=f"signup_{msg_id}"))
-        self.add_item(Button(label="❌ Отписаться", style=discord.ButtonStyle.danger, custom_id=f"leave_{msg_id}"))
+        if options:
+            self.add_item(Select(custom_id=f"pick_{msg_id}", placeholder="✅ Записаться — выбери свободный слот", options=options))
+        else:
+            self.add_item(Select(custom_id=f"pick_{msg_id}", placeholder="Свободных слотов нет", disabled=True,
+                                 options=[discord.SelectOption(label="—", value="0")]))
+        if free_count > PAGE_SIZE:
+            self.add_item(Button(label=f"Ещё свободные слоты ({free_count - PAGE_SIZE})", style=discord.ButtonStyle.primary,
+                                 custom_id=f"signup_{msg_id}:1", row=1))
+        self.add_item(Button(label="❌ Отписаться", style=discord.ButtonStyle.danger, custom_id=f"leave_{msg_id}", row=1))
+
+class SlotPickerView(View):
+    """Эфемерное меню слотов по страницам: action — что делает выбор, nav — листание"""
+    def __init__(self, action, nav, msg_id, options, page):
+        super().__init__(timeout=None)
+        pages = max(1, (len(options) + PAGE_SIZE - 1) // PAGE_SIZE)
+        page = max(0, min(page, pages - 1))
+        self.add_item(Select(custom_id=f"{action}_{msg_id}", placeholder=f"Слоты — страница {page+1}/{pages}",
+                             options=options[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]))
+        if page > 0:
+            self.add_item(Button(label="◀", custom_id=f"{nav}_{msg_id}:{page-1}", row=1))
+        if page < pages - 1:
+            self.add_item(Button(label="▶", custom_id=f"{nav}_{msg_id}:{page+1}", row=1))
+
+def label_name(raid, user):
+    """Участник в подписи варианта меню: упоминания там не раскрываются, поэтому без <@id>"""
+    if isinstance(user, str):
+        return user  # старые данные хранили имя
+    guild = bot.get_guild(raid.guild_id) if raid.guild_id else None
+    return member_names.resolve(user, guild) or f"id {user}"
+
+def slot_options(raid, indices, with_user=False):
+    options = []
+    for i in indices:
+        slot = raid.slots[i]
+        label = f"{i+1}. {slot.role}"
+        if with_user:
+            label += f" — {label_name(raid, slot.user)}"
+        options.append(discord.SelectOption(label=label[:100], value=str(i+1)))
+    return options
+
+def signup_view(msg_id, raid):
+    free = slot_book.free_slots(msg_id, raid)
+    return components_only(RaidSignupView(msg_id, slot_options(raid, free[:PAGE_SIZE]), len(free)))
+
+def components_only(view):
+    """Остановленный view discord.py не кладёт в свой store: кнопки уходят в сообщение,
+    а нажатия разбирает on_interaction — память не растёт с числом рейдов"""
+    view.stop()
+    return view
+
+_panel_view = None
+
+def panel_view():
+    global _panel_view
+    if _panel_view is None:
+        _panel_view = components_only(CreateRaidPanel())  # View создаётся только внутри цикла событий
+    return _panel_view
 
 # ================== EMBED ==================
-def generate_embed(raid):
-    desc = f"**Описание:** {raid['desc']}\n**Время:** {raid['time']}\n\n**Участники:**\n"
-    for i, slot in enumerate(raid['slots'], start=1):
-        user_text = slot['user'] if slot['user'] else "—"
-        desc += f"{i} {slot['role']}: {user_text}\n"
-    embed = discord.Embed(
-        title=f"⚔️ {raid['name']}",
-        description=desc,
-        color=discord.Color.orange()
-    )
-    embed.set_footer(text=f"Создано: {raid['author_name']}")
-    return embed
-
-# ================== ГЛОБАЛЬНЫЙ ФЛАГ ДЛЯ ЗАЩИТЫ ОТ ЦИКЛА ==================
-deleting_panel = False
+def member_name(raid, user_id):
+    """Имя участника для embed: кэш, затем участники сервера, иначе упоминание"""
+    guild = bot.get_guild(raid.guild_id) if raid.guild_id else None
+    return member_names.resolve(user_id, guild) or f"<@{user_id}>"
+
+renderer = RaidRenderer(member_name)  # кэш embed по версии состава (см. render.py)
+
+def generate_embed(raid, raid_id=None, finished=False):
+    version = slot_book.version(raid_id) if raid_id else 0
+    return renderer.render(raid_id, raid, version, finished)
+
+# ================== ОТЛОЖЕННЫЕ ПРАВКИ ==================
+@timed(m_edit_seconds, kind="roster")
+async def edit_raid_message(channel_id, msg_id):
+    raid = raids.get(msg_id)
+    channel = bot.get_channel(channel_id)
+    if not raid or not channel:
+        return  # рейд уже завершён или канал недоступен
+    msg = channel.get_partial_message(int(msg_id))
+    # вместе с составом обновляем меню свободных слотов
+    await msg.edit(embed=generate_embed(raid, msg_id), view=signup_view(msg_id, raid))
+    m_edits.inc(kind="roster")
+
+# запись в рейд отвечает сразу, а сообщение правится одной пачкой раз в секунду
+raid_edits = EditScheduler(edit_raid_message, delay=1.0)
 
 # ================== ПАНЕЛЬ ==================
+# каналы обновляются параллельно (до 5 сразу), в одном канале — по очереди;
+# свои удаления помечаются по id сообщения (см. panels.py)
+panels = PanelManager(concurrency=5)
+
+def is_panel_message(msg):
+    return msg.author == bot.user and msg.embeds and msg.embeds[0].title == PANEL_TITLE
+
 async def send_create_panel(channel):
-    global deleting_panel
     if is_channel_blocked(channel.id):
         return
-
-    deleting_panel = True  # бот сам удаляет панели
-    async for msg in channel.history(limit=50):
-        if msg.author == bot.user and msg.embeds and msg.embeds[0].title == "🎯 Создание рейда":
-            try:
-                await msg.delete()
-                await asyncio.sleep(0.5)
-            except:
-                continue
-    deleting_panel = False  # закончили удаление
+    async with panels.channel(channel.id):
+        return await replace_panel(channel)
+
+async def replace_panel(channel):
+    """Удаляем старую панель и шлём новую; вызывать под panels.channel()"""
+    panel_id = panel_index.pop(str(channel.id), None)
+    if panel_id:
+        old = [channel.get_partial_message(panel_id)]
+    else:
+        # индекса нет (старые данные) — ищем панели по истории
+        m_history_scans.inc(where="send_panel")
+        old = [msg async for msg in channel.history(limit=50) if is_panel_message(msg)]
+    await panels.delete(channel, old)
 
     embed = discord.Embed(
-        title="🎯 Создание рейда",
+        title=PANEL_TITLE,
         description="Нажми кнопку ниже, чтобы создать новый слот рейда.",
         color=discord.Color.blue()
     )
-    view = CreateRaidPanel()
-    msg = await channel.send(embed=embed, view=view)
+    msg = await channel.send(embed=embed, view=panel_view())
+    panel_index[str(channel.id)] = msg.id
+    save_panels()
 
     if channel.id not in channels_data:
         channels_data.append(channel.id)
-        save_json(CHANNEL_FILE, channels_data)
+        save_channels()
     return msg
 
 # ================== ОБНОВЛЕНИЕ ПАНЕЛЕЙ ==================
-@tasks.loop(seconds=UPDATE_INTERVAL)
-async def refresh_panels_loop():
-    for ch_id in channels_data:
-        channel = bot.get_channel(ch_id)
-        if not channel or is_channel_blocked(ch_id):
-            continue
+async def refresh_panel(ch_id):
+    channel = bot.get_channel(ch_id)
+    if not channel or is_channel_blocked(ch_id):
+        return
 
+    async with panels.channel(ch_id):
         found = False
-        async for msg in channel.history(limit=50):
-            if msg.author == bot.user and msg.embeds and msg.embeds[0].title == "🎯 Создание рейда":
+        panel_id = panel_index.get(str(ch_id))
+        if panel_id:
+            try:
+                await channel.fetch_message(panel_id)
                 found = True
-                break
+            except discord.NotFound:
+                panel_index.pop(str(ch_id), None)
+            except discord.HTTPException:
+                return  # Discord временно недоступен — проверим в следующий раз
+        else:
+            m_history_scans.inc(where="refresh")
+            async for msg in channel.history(limit=50):
+                if is_panel_message(msg):
+                    panel_index[str(ch_id)] = msg.id
+                    save_panels()
+                    found = True
+                    break
 
         if not found:
-            print(f"🔄 Панель в {channel.name} отсутствует — создаем новую")
-            await send_create_panel(channel)
+            log.info(f"🔄 Панель в {channel.name} отсутствует — создаем новую")
+            await replace_panel(channel)
+
+@tasks.loop(seconds=UPDATE_INTERVAL)
+@timed(m_loop, loop="refresh_panels")
+async def refresh_panels_loop():
+    ids = list(channels_data)
+    results = await asyncio.gather(*(refresh_panel(ch_id) for ch_id in ids), return_exceptions=True)
+    for ch_id, result in zip(ids, results):
+        if isinstance(result, Exception):
+            log.error(f"❌ Ошибка обновления панели в канале {ch_id}", exc_info=result)
+
+@refresh_panels_loop.before_loop
+async def before_refresh_panels():
+    await asyncio.sleep(WARMUP_DELAY)  # сначала отвечаем на клики, потом проверяем панели
 
 # ================== ВОССТАНОВЛЕНИЕ УДАЛЕННОЙ ПАНЕЛИ ==================
-@bot.event
-async def on_message_delete(message):
-    global deleting_panel
-    if deleting_panel:  # бот сам удалял — игнорируем
+# Сырые события приходят и без кэша сообщений (LEAN_MODE): панель узнаём по
+# индексу panel_index, а если сообщение было в кэше — ещё и по заголовку.
+async def panel_deleted(channel_id, message_id, cached=None):
+    if panels.deleted_by_bot(message_id):  # бот сам удалял — игнорируем
         return
-    if not message.guild or message.author != bot.user:
+    if panel_index.get(str(channel_id)) == message_id:
+        panel_index.pop(str(channel_id))
+        save_panels()
+    elif not (cached and is_panel_message(cached)):
         return
 
-    if message.embeds and message.embeds[0].title == "🎯 Создание рейда":
-        channel_id = message.channel.id
-        if channel_id in channels_data and not is_channel_blocked(channel_id):
-            await asyncio.sleep(2)
-            print(f"♻️ Панель в {message.channel.name} была удалена — восстанавливаем...")
-            await send_create_panel(message.channel)
+    channel = bot.get_channel(channel_id)
+    if channel and channel_id in channels_data and not is_channel_blocked(channel_id):
+        await asyncio.sleep(2)
+        log.info(f"♻️ Панель в {channel.name} была удалена — восстанавливаем...")
+        await send_create_panel(channel)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    if payload.guild_id is None:
+        return
+    await panel_deleted(payload.channel_id, payload.message_id, payload.cached_message)
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    panel_id = panel_index.get(str(payload.channel_id))
+    if payload.guild_id is not None and panel_id in payload.message_ids:
+        await panel_deleted(payload.channel_id, panel_id)
 
 # ================== КОМАНДА ДЛЯ АДМИНА ==================
 @bot.command()
@@ -154,198 +454,344 @@ async def createpanel(ctx):
     await ctx.send("✅ Панель создания рейда добавлена!", delete_after=5)
 
 # ================== ВЗАИМОДЕЙСТВИЯ ==================
+# Кнопки не регистрируются через bot.add_view: custom_id разбирается один раз
+# и уходит в обработчик из таблицы COMPONENT_HANDLERS.
+
+# -------- Создать рейд --------
+async def handle_create_raid(interaction: discord.Interaction, arg):
+    if not permissions.can(interaction.user, interaction.guild, CREATE_RAID):
+        await interaction.response.send_message("❌ Только админ или РЛ могут создавать рейд!", ephemeral=True)
+        return
+
+    class RaidModal(Modal, title="Создание рейда"):
+        raid_name = TextInput(label="Название рейда", placeholder="Например: Рейд в Мартлок", required=True)
+        raid_desc = TextInput(label="Описание", style=discord.TextStyle.long, placeholder="УРОВЕНЬ БРОНИ\n \n...", required=True)
+        raid_time = TextInput(label="Время рейда", placeholder="20:00 МСК", required=True)
+        raid_slots = TextInput(label="Слоты (по одной роли в строке)", style=discord.TextStyle.long, placeholder="Танк\nПорезка\nДД\nДД\n...", required=True)
+
+        @timed(m_handler, handler="create_submit")
+        async def on_submit(self, inter_sub: discord.Interaction):
+            slots = [Slot(line.strip()) for line in self.raid_slots.value.split("\n") if line.strip()]
+            raid = Raid(
+                name=self.raid_name.value,
+                desc=self.raid_desc.value,
+                time=self.raid_time.value,
+                author_id=inter_sub.user.id,
+                author_name=inter_sub.user.display_name,
+                slots=slots,
+                created_at=time.time(),
+                channel_id=inter_sub.channel.id,
+                guild_id=inter_sub.guild.id if inter_sub.guild else None
+            )
+            msg = await inter_sub.channel.send(f"@everyone", embed=generate_embed(raid))
+            raids[str(msg.id)] = raid
+            save_raid(str(msg.id), raid)
+            expiry.schedule(str(msg.id), raid_deadline(raid))
+            # отвечаем сразу: на модалку 3 секунды, а очередь правок канала может быть длиннее
+            await inter_sub.response.send_message("✅ Рейд успешно создан!", ephemeral=True)
+            await raid_edits.reserve(raid.channel_id)
+            await msg.edit(view=signup_view(str(msg.id), raid))
+            await asyncio.sleep(1)
+            await send_create_panel(inter_sub.channel)  # обновляем панель после создания рейда
+
+    await interaction.response.send_modal(RaidModal())
+
+# -------- Записаться --------
+# Запись — выбор в меню под рейдом: одно взаимодействие, без модалки и без
+# неверных номеров. Кнопка «Ещё свободные слоты» (больше 25) и отписка
+# открывают эфемерное меню со страницами.
+def split_page(arg):
+    """<id> -> (<id>, None); <id>:<страница> -> (<id>, страница)"""
+    msg_id, _, page = arg.partition(":")
+    return msg_id, int(page) if page.isdigit() else None
+
+async def show_picker(interaction, view, text, edit):
+    if edit:  # листаем уже открытое эфемерное меню
+        await interaction.response.edit_message(content=text, view=view)
+    else:
+        await interaction.response.send_message(text, view=view, ephemeral=True)
+
+def picked_slot(interaction):
+    try:
+        return int(interaction.data["values"][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+async def handle_signup(interaction: discord.Interaction, arg, edit=False):
+    msg_id, page = split_page(arg)
+    raid = raids.get(msg_id)
+    if not raid:
+        return await interaction.response.send_message("❌ Рейд не найден", ephemeral=True)
+
+    if slot_book.user_slot(msg_id, raid, interaction.user.id):
+        return await interaction.response.send_message("❌ Ты уже записан", ephemeral=True)
+
+    free = slot_book.free_slots(msg_id, raid)
+    if not free:
+        return await interaction.response.send_message("❌ Свободных слотов нет", ephemeral=True)
+    view = components_only(SlotPickerView("pick", "signpage", msg_id, slot_options(raid, free), page or 0))
+    await show_picker(interaction, view, "Выбери слот:", edit)
+
+async def handle_pick(interaction: discord.Interaction, msg_id):
+    raid = raids.get(msg_id)
+    if not raid:
+        return await interaction.response.send_message("❌ Рейд не найден", ephemeral=True)
+    num = picked_slot(interaction)
+    if num is None:
+        return await interaction.response.send_message("❌ Неверный номер слота", ephemeral=True)
+
+    member_names.remember(interaction.user.id, interaction.user.display_name)
+    async with slot_book.lock(msg_id):
+        result = slot_book.claim(msg_id, raid, num, interaction.user.id)
+        if result == CLAIMED:
+            save_raid(msg_id, raid)
+
+    if result == ALREADY_SIGNED:
+        await interaction.response.send_message("❌ Ты уже записан", ephemeral=True)
+        return
+    if result == SLOT_TAKEN:
+        await interaction.response.send_message("❌ Слот занят", ephemeral=True)
+        return
+    if result != CLAIMED:
+        await interaction.response.send_message("❌ Неверный номер слота", ephemeral=True)
+        return
+
+    slot = raid.slots[num-1]
+    await interaction.response.send_message(f"✅ Ты записался в слот {num} ({slot.role})", ephemeral=True)
+    raid_edits.schedule(raid.channel_id, msg_id)
+
+# -------- Отписка --------
+def can_clear(user, raid):
+    return user.id == ADMIN_ID or user.id == raid.author_id
+
+async def handle_leave(interaction: discord.Interaction, arg, edit=False):
+    msg_id, page = split_page(arg)
+    raid = raids.get(msg_id)
+    if not raid:
+        return await interaction.response.send_message("❌ Рейд не найден", ephemeral=True)
+
+    if not can_clear(interaction.user, raid):
+        return await interaction.response.send_message("❌ Ты не можешь отписывать участников", ephemeral=True)
+
+    taken = [i for i, slot in enumerate(raid.slots) if slot.user]
+    if not taken:
+        return await interaction.response.send_message("❌ Все слоты свободны", ephemeral=True)
+    view = components_only(SlotPickerView("clear", "leavepage", msg_id, slot_options(raid, taken, with_user=True), page or 0))
+    await show_picker(interaction, view, "Какой слот очистить?", edit)
+
+async def handle_clear(interaction: discord.Interaction, msg_id):
+    raid = raids.get(msg_id)
+    if not raid:
+        return await interaction.response.send_message("❌ Рейд не найден", ephemeral=True)
+    if not can_clear(interaction.user, raid):
+        return await interaction.response.send_message("❌ Ты не можешь отписывать участников", ephemeral=True)
+    num = picked_slot(interaction)
+    if num is None or num < 1 or num > len(raid.slots):
+        return await interaction.response.send_message("❌ Неверный номер слота", ephemeral=True)
+
+    async with slot_book.lock(msg_id):
+        if slot_book.release(msg_id, raid, num):
+            save_raid(msg_id, raid)
+    await interaction.response.send_message(f"✅ Слот {num} очищен", ephemeral=True)
+    raid_edits.schedule(raid.channel_id, msg_id)
+
+COMPONENT_HANDLERS = {
+    "create_raid": handle_create_raid,
+    "signup": handle_signup,
+    "signpage": partial(handle_signup, edit=True),
+    "pick": handle_pick,
+    "leave": handle_leave,
+    "leavepage": partial(handle_leave, edit=True),
+    "clear": handle_clear,
+}
+
+def parse_custom_id(cid):
+    """create_raid -> (create_raid, None); signup_<id> -> (signup, <id>)"""
+    if cid in COMPONENT_HANDLERS:
+        return cid, None
+    action, _, arg = cid.partition("_")
+    return action, arg
+
 @bot.event
 async def on_interaction(interaction: discord.Interaction):
     try:
         if not interaction.data:
             return
         cid = interaction.data.get("custom_id")
+        if not cid:
+            return
 
         if is_channel_blocked(interaction.channel.id):
             await interaction.response.send_message("❌ Действия в этом канале временно заблокированы", ephemeral=True)
             return
 
-        # -------- Создать рейд --------
-        if cid == "create_raid":
-            member_roles = [r.name for r in interaction.user.roles]
-            if not (interaction.user.id == ADMIN_ID or RL_ROLE_NAME in member_roles):
-                await interaction.response.send_message("❌ Только админ или РЛ могут создавать рейд!", ephemeral=True)
-                return
-
-            class RaidModal(Modal, title="Создание рейда"):
-                raid_name = TextInput(label="Название рейда", placeholder="Например: Рейд в Мартлок", required=True)
-                raid_desc = TextInput(label="Описание", style=discord.TextStyle.long, placeholder="УРОВЕНЬ БРОНИ\n \n...", required=True)
-                raid_time = TextInput(label="Время рейда", placeholder="20:00 МСК", required=True)
-                raid_slots = TextInput(label="Слоты (по одной роли в строке)", style=discord.TextStyle.long, placeholder="Танк\nПорезка\nДД\nДД\n...", required=True)
-
-                async def on_submit(self, inter_sub: discord.Interaction):
-                    slots = [{"role": line.strip(), "user": None} for line in self.raid_slots.value.split("\n") if line.strip()]
-                    raid = {
-                        "name": self.raid_name.value,
-                        "desc": self.raid_desc.value,
-                        "time": self.raid_time.value,
-                        "author_id": inter_sub.user.id,
-                        "author_name": inter_sub.user.display_name,
-                        "slots": slots,
-                        "created_at": time.time(),
-                        "channel_id": inter_sub.channel.id
-                    }
-                    msg = await inter_sub.channel.send(f"@everyone", embed=generate_embed(raid))
-                    raids[str(msg.id)] = raid
-                    save_json(DATA_FILE, raids)
-                    await msg.edit(view=RaidSignupView(msg.id))
-                    await inter_sub.response.send_message("✅ Рейд успешно создан!", ephemeral=True)
-                    await asyncio.sleep(1)
-                    await send_create_panel(inter_sub.channel)  # обновляем панель после создания рейда
-
-            await interaction.response.send_modal(RaidModal())
-
-        # -------- Записаться --------
-        elif cid.startswith("signup_"):
-            msg_id = cid.split("_")[1]
-            raid = raids.get(msg_id)
-            if not raid:
-                return await interaction.response.send_message("❌ Рейд не найден", ephemeral=True)
-
-            if any(slot['user'] == interaction.user.display_name for slot in raid['slots']):
-                return await interaction.response.send_message("❌ Ты уже записан", ephemeral=True)
-
-            class SlotModal(Modal, title="Выбор слота"):
-                slot_number = TextInput(label=f"Выбери номер слота (1-{len(raid['slots'])})", placeholder="Например: 2", required=True)
-
-                async def on_submit(self, modal_inter: discord.Interaction):
-                    try:
-                        num = int(self.slot_number.value)
-                        if num < 1 or num > len(raid['slots']):
-                            await modal_inter.response.send_message("❌ Неверный номер слота", ephemeral=True)
-                            return
-                    except:
-                        await modal_inter.response.send_message("❌ Неверный номер слота", ephemeral=True)
-                        return
-
-                    slot = raid['slots'][num-1]
-                    if slot['user']:
-                        await modal_inter.response.send_message("❌ Слот занят", ephemeral=True)
-                        return
-
-                    slot['user'] = modal_inter.user.display_name
-                    save_json(DATA_FILE, raids)
-                    await modal_inter.message.edit(embed=generate_embed(raid), view=RaidSignupView(msg_id))
-                    await modal_inter.response.send_message(f"✅ Ты записался в слот {num} ({slot['role']})", ephemeral=True)
-
-            await interaction.response.send_modal(SlotModal())
-
-        # -------- Отписка --------
-        elif cid.startswith("leave_"):
-            msg_id = cid.split("_")[1]
-            raid = raids.get(msg_id)
-            if not raid:
-                return await interaction.response.send_message("❌ Рейд не найден", ephemeral=True)
-
-            if not (interaction.user.id == ADMIN_ID or interaction.user.id == raid['author_id']):
-                return await interaction.response.send_message("❌ Ты не можешь отписывать участников", ephemeral=True)
-
-            class RemoveModal(Modal, title="Отписка участника"):
-                slot_number = TextInput(label=f"Введите номер слота для очистки (1-{len(raid['slots'])})", required=True)
-
-                async def on_submit(self, modal_inter: discord.Interaction):
-                    try:
-                        num = int(self.slot_number.value)
-                        if num < 1 or num > len(raid['slots']):
-                            await modal_inter.response.send_message("❌ Неверный номер слота", ephemeral=True)
-                            return
-                    except:
-                        await modal_inter.response.send_message("❌ Неверный номер слота", ephemeral=True)
-                        return
-
-                    raid['slots'][num-1]['user'] = None
-                    save_json(DATA_FILE, raids)
-                    await modal_inter.message.edit(embed=generate_embed(raid), view=RaidSignupView(msg_id))
-                    await modal_inter.response.send_message(f"✅ Слот {num} очищен", ephemeral=True)
-
-            await interaction.response.send_modal(RemoveModal())
-
-    except Exception as e:
-        print(f"❌ Ошибка взаимодействия: {e}")
-        traceback.print_exc()
-
-# ================== ОЧИСТКА СТАРЫХ РЕЙДОВ ==================
-@tasks.loop(minutes=30)
-async def cleanup_old_raids():
-    now = time.time()
-    expired = [k for k,v in raids.items() if now - v.get("created_at", now) > RAID_EXPIRE]
-    for k in expired:
-        raid = raids[k]
-        channel = bot.get_channel(raid.get("channel_id"))
-        if channel:
-            try:
-                msg = await channel.fetch_message(int(k))
-                embed = generate_embed(raid)
-                embed.color = discord.Color.light_grey()
-                embed.title += " [Завершён]"
-                embed.description += "\n⚠️ Рейд завершён"
-                await msg.edit(embed=embed, view=None)
-            except:
-                pass
-        raids.pop(k)
-    if expired:
-        save_json(DATA_FILE, raids)
-
-# ================== АВТОМАТИЧЕСКАЯ ОЧИСТКА ЛОГОВ И ФАЙЛОВ ==================
-LOG_FILES = ["bot.log", "bot_output.log"]
-MAX_LOG_SIZE_MB = 5
+        action, arg = parse_custom_id(cid)
+        handler = COMPONENT_HANDLERS.get(action)
+        if handler:  # модалки и чужие компоненты сюда не попадают
+            m_interactions.inc(action=action)
+            with m_handler.time(handler=action):
+                await handler(interaction, arg)
+
+    except Exception:
+        log.exception(f"❌ Ошибка взаимодействия {interaction.data.get('custom_id')}")
+
+# ================== ЗАВЕРШЕНИЕ СТАРЫХ РЕЙДОВ ==================
+def raid_deadline(raid):
+    return raid.created_at + RAID_EXPIRE
+
+@timed(m_loop, loop="finalize_raid")
+async def finalize_raid(k):
+    raid = raids.get(k)
+    if not raid:
+        return
+    await bot.wait_until_ready()  # после рестарта просроченные рейды ждут кэш каналов
+    # за время ожидания рейд могли отпустить, а старый рейд без guild_id становится
+    # понятно чей, только когда кэш каналов готов — чужой не трогаем
+    raid = raids.get(k)
+    if not raid or not owns_raid(raid):
+        return
+    channel = bot.get_channel(raid.channel_id)
+    if channel:
+        try:
+            embed = generate_embed(raid, k, finished=True)
+            await raid_edits.reserve(raid.channel_id)  # общее окно правок канала с записью
+            await channel.get_partial_message(int(k)).edit(embed=embed, view=None)
+            m_edits.inc(kind="finalize")
+        except:
+            pass
+    archive_raid(k, raid)  # состав не теряем — уходит в недельный архив
+    delete_raid(k)
+
+# каждый рейд завершается в свой срок, не больше 5 правок одновременно
+expiry = ExpiryScheduler(finalize_raid, concurrency=5)
+
+# ================== СЖАТИЕ ЖУРНАЛА ==================
+@tasks.loop(minutes=5)
+@timed(m_loop, loop="compact_storage")
+async def compact_storage_loop():
+    if not store.needs_compaction():
+        return
+    await writer.run(store.compaction_job())  # снимок берём в цикле событий
+
+# ================== АВТОМАТИЧЕСКАЯ ОЧИСТКА ФАЙЛОВ ==================
+# логи не трогаем — их ротирует logs.py
 MAX_RAIDS_FILE_AGE_HOURS = 12
 
+def file_mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+def reset_channel_file():
+    shutil.copy(CHANNEL_FILE, f"{CHANNEL_FILE}.bak")
+    save_json(CHANNEL_FILE, [])
+
 @tasks.loop(minutes=60)
+@timed(m_loop, loop="cleanup_files")
 async def cleanup_files_loop():
     now = time.time()
 
-    # Очистка логов
-    for log in LOG_FILES:
-        if os.path.exists(log):
-            size_mb = os.path.getsize(log) / (1024 * 1024)
-            if size_mb > MAX_LOG_SIZE_MB:
-                with open(log, "w", encoding="utf-8") as f:
-                    f.write("")
-                print(f"🧹 Очищен лог {log} ({size_mb:.1f} МБ)")
-
-    # Очистка raids.json если нет активных рейдов
-    if os.path.exists(DATA_FILE):
-        raids_data = load_json(DATA_FILE, {})
-        active_raids = sum(1 for r in raids_data.values() if now - r.get("created_at", now) < RAID_EXPIRE)
-        if active_raids == 0:
-            mtime = os.path.getmtime(DATA_FILE)
-            if now - mtime > MAX_RAIDS_FILE_AGE_HOURS * 3600:
-                save_json(DATA_FILE, {})
-                print(f"🗑️ Очищен файл {DATA_FILE} — старых рейдов нет")
+    # Очистка raids.json, если рейдов нет и файл давно не писался. Просроченные рейды
+    # не трогаем — их завершает expiry (с пометкой «Завершён» и архивом).
+    # Снимок переписывается только при сжатии, поэтому смотрим и на журнал.
+    # В SQLite нечего сбрасывать, а база общая для шардов — DELETE снёс бы чужие рейды.
+    mtime = None if STORAGE_BACKEND == "sqlite" else max(filter(None, [await writer.run(file_mtime, DATA_FILE),
+                              await writer.run(file_mtime, f"{DATA_FILE}.journal")]), default=None)
+    if not raids and mtime is not None and now - mtime > MAX_RAIDS_FILE_AGE_HOURS * 3600:
+        slot_book.clear()
+        renderer.clear()
+        expiry.clear()
+        store.clear_raids()
+        await writer.flush()
+        log.info(f"🗑️ Очищен файл {DATA_FILE} — старых рейдов нет")
 
     # Очистка channel.json, если старше недели
-    if os.path.exists(CHANNEL_FILE):
-        mtime = os.path.getmtime(CHANNEL_FILE)
-        if now - mtime > 7 * 24 * 3600:
-            shutil.copy(CHANNEL_FILE, f"{CHANNEL_FILE}.bak")
-            save_json(CHANNEL_FILE, [])
-            print("🧾 channel.json очищен (создан бэкап .bak)")
+    mtime = await writer.run(file_mtime, CHANNEL_FILE)
+    if mtime is not None and now - mtime > 7 * 24 * 3600:
+        await writer.run(reset_channel_file)
+        log.info("🧾 channel.json очищен (создан бэкап .bak)")
+
+# ================== СТАТИСТИКА ПО АРХИВУ ==================
+# Считается потоком по недельным сегментам в потоке записи — архив в память не грузится.
+STATS_WEEKS = 4
+STATS_TOP = 20
+
+def stats_since(weeks):
+    return time.time() - weeks * 7 * 24 * 3600
+
+def stats_name(guild, user):
+    if isinstance(user, str):
+        return user  # старые рейды хранили имя
+    return member_names.resolve(user, guild) or f"<@{user}>"
+
+async def send_stats(ctx, title, lines, raids_count):
+    embed = discord.Embed(title=title, description="\n".join(lines) or "В архиве пока нет рейдов", color=discord.Color.blurple())
+    embed.set_footer(text=f"Завершённых рейдов: {raids_count}")
+    await ctx.send(embed=embed)
+
+@bot.command()
+async def attendance(ctx, weeks: int = STATS_WEEKS):
+    """Кто чаще ходил в рейды за последние N недель"""
+    weeks = max(1, min(weeks, 520))
+    await writer.flush()  # только что завершённые рейды тоже считаем
+    guild_id = ctx.guild.id if ctx.guild else None
+    raids_count, top = await writer.run(archive.attendance, guild_id, stats_since(weeks), STATS_TOP)
+    lines = [f"{i}. {stats_name(ctx.guild, user)} — {n}" for i, (user, n) in enumerate(top, start=1)]
+    await send_stats(ctx, f"📊 Посещаемость за {weeks} нед.", lines, raids_count)
+
+@bot.command()
+async def leaders(ctx, weeks: int = STATS_WEEKS):
+    """Сколько рейдов собрал каждый РЛ за последние N недель"""
+    weeks = max(1, min(weeks, 520))
+    await writer.flush()
+    guild_id = ctx.guild.id if ctx.guild else None
+    raids_count, top = await writer.run(archive.leaders, guild_id, stats_since(weeks), STATS_TOP)
+    lines = [f"{i}. {name or f'<@{author_id}>'} — {n}" for i, (author_id, name, n) in enumerate(top, start=1)]
+    await send_stats(ctx, f"📊 Рейды по РЛ за {weeks} нед.", lines, raids_count)
 
 # ================== Инициализация admin.py ==================
-setup_admin(bot, channels_data)
+setup_admin(bot, channels_data, save_blocks)
 
 # ================== Глобальная проверка команд ==================
 @bot.check
 async def global_block_check(ctx):
     return not is_channel_blocked(ctx.channel.id)
 
+# ================== ШАРДЫ ==================
+def drop_foreign_raids():
+    """После готовности кэша отдаём чужие старые рейды их воркерам"""
+    foreign = [k for k, v in raids.items() if not owns_raid(v)]
+    for k in foreign:
+        forget_raid(k)
+    if foreign:
+        log.info(f"🧩 Рейдов других шардов отпущено: {len(foreign)}")
+
+@tasks.loop(seconds=60)
+async def sync_blocks_loop():
+    """Блокировки ставятся в любом воркере — подтягиваем общие из базы"""
+    await writer.flush()
+    fresh = await writer.run(store.load_blocks)
+    blocked_channels.load(fresh)
+
 # ================== СТАРТ ==================
 @bot.event
 async def on_ready():
-    print(f"✅ Бот запущен как {bot.user}")
+    log.info(f"✅ Бот запущен как {bot.user}")
+    if SHARD_COUNT:
+        drop_foreign_raids()
+    if SHARD_IDS:  # блокировки других воркеров — только если шарды поделены
+        if not sync_blocks_loop.is_running():
+            sync_blocks_loop.start()
     if not refresh_panels_loop.is_running():
         refresh_panels_loop.start()
-    if not cleanup_old_raids.is_running():
-        cleanup_old_raids.start()
     if not cleanup_files_loop.is_running():
         cleanup_files_loop.start()
-    for raid_id in raids:
-        bot.add_view(RaidSignupView(raid_id))
-
-bot.run(TOKEN)
+    if not compact_storage_loop.is_running():
+        compact_storage_loop.start()
+
+if __name__ == "__main__":
+    if not TOKEN:
+        log.error("❌ TOKEN не найден")
+        exit(1)
+    if SHARD_IDS and STORAGE_BACKEND != "sqlite":  # один процесс на все шарды обходится JSON
+        log.error("❌ Для воркеров с частью шардов нужно общее хранилище: STORAGE_BACKEND=sqlite")
+        exit(1)
+    bot.run(TOKEN, log_handler=None)  # логи discord.py идут в нашу очередь
@@ -0,0 +1,65 @@
+# edits.py
+import asyncio, time, logging
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+# Discord режет правки сообщений примерно 5 штук за 5 секунд на канал
+CHANNEL_EDITS = 5
+CHANNEL_PERIOD = 5.0
+
+class EditScheduler:
+    """Отложенные правки сообщений рейдов
+
+    schedule() только помечает сообщение «грязным». Через delay секунд делается
+    одна правка с самым свежим состоянием, все изменения за это время схлопываются.
+    Правки одного канала разносятся во времени, чтобы не упираться в 429.
+    """
+
+    def __init__(self, edit, delay=1.0):
+        self.edit = edit        # async edit(channel_id, msg_id) — сама правка
+        self.delay = delay
+        self.dirty = set()
+        self.tasks = {}         # msg_id -> задача правки
+        self.channel_edits = {} # channel_id -> время последних правок
+
+    def schedule(self, channel_id, msg_id):
+        self.dirty.add(msg_id)
+        if msg_id not in self.tasks:
+            self.tasks[msg_id] = asyncio.create_task(self._worker(channel_id, msg_id))
+
+    def _reserve(self, channel_id):
+        """Бронируем место в окне канала, возвращаем сколько ждать"""
+        now = time.monotonic()
+        stamps = self.channel_edits.setdefault(channel_id, deque())
+        while stamps and stamps[0] <= now - CHANNEL_PERIOD:
+            stamps.popleft()
+        start = now
+        if len(stamps) >= CHANNEL_EDITS:
+            start = stamps[-CHANNEL_EDITS] + CHANNEL_PERIOD
+        stamps.append(start)
+        return start - now
+
+    async def reserve(self, channel_id):
+        """Ждём своей очереди в окне канала — для правок в обход schedule()"""
+        wait = self._reserve(channel_id)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _worker(self, channel_id, msg_id):
+        try:
+            while msg_id in self.dirty:
+                await asyncio.sleep(self.delay)
+                await self.reserve(channel_id)
+                self.dirty.discard(msg_id)  # всё, что придёт во время правки, уйдёт следующей
+                try:
+                    await self.edit(channel_id, msg_id)
+                except Exception:
+                    log.exception(f"❌ Ошибка обновления сообщения {msg_id}")
+        finally:
+            self.tasks.pop(msg_id, None)
+
+    async def flush(self):
+        """Дожидаемся отложенных правок (при остановке бота)"""
+        if self.tasks:
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
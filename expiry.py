@@ -0,0 +1,81 @@
+# expiry.py
+import asyncio, heapq, time, logging
+
+log = logging.getLogger(__name__)
+
+class ExpiryScheduler:
+    """Завершение рейдов по сроку
+
+    Дедлайны лежат в min-heap, задача спит ровно до ближайшего. Отменённые и
+    перенесённые рейды не вынимаются из кучи, а отбрасываются при извлечении.
+    Просроченные рейды завершаются параллельно, но не больше concurrency за раз —
+    после простоя бота очередь разгребается быстро и без 429.
+    """
+
+    def __init__(self, finalize, concurrency=5):
+        self.finalize = finalize  # async finalize(raid_id)
+        self.concurrency = concurrency
+        self.heap = []            # [(deadline, raid_id)]
+        self.deadlines = {}       # raid_id -> актуальный дедлайн
+        self.running = set()
+        self._wake = None
+        self._semaphore = None
+        self._task = None
+
+    def start(self, delay=0):
+        """delay — не завершать ничего первые секунды после старта бота"""
+        self._wake = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run(delay))
+
+    def schedule(self, raid_id, deadline):
+        self.deadlines[raid_id] = deadline
+        heapq.heappush(self.heap, (deadline, raid_id))
+        if self._wake and self.heap[0][1] == raid_id:
+            self._wake.set()  # новый дедлайн раньше того, до которого спим
+
+    def cancel(self, raid_id):
+        self.deadlines.pop(raid_id, None)
+
+    def clear(self):
+        self.heap.clear()
+        self.deadlines.clear()
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, raid_id = heapq.heappop(self.heap)
+            if self.deadlines.get(raid_id) == deadline:
+                del self.deadlines[raid_id]
+                due.append(raid_id)
+        return due
+
+    def _next_deadline(self):
+        while self.heap and self.deadlines.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)  # устаревшая запись
+        return self.heap[0][0] if self.heap else None
+
+    async def _run(self, delay=0):
+        if delay:
+            await asyncio.sleep(delay)
+        while True:
+            self._wake.clear()
+            deadline = self._next_deadline()
+            delay = None if deadline is None else deadline - time.time()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for raid_id in self._pop_due(time.time()):
+                task = asyncio.create_task(self._finalize(raid_id))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+
+    async def _finalize(self, raid_id):
+        async with self._semaphore:
+            try:
+                await self.finalize(raid_id)
+            except Exception:
+                log.exception(f"❌ Ошибка завершения рейда {raid_id}")
@@ -0,0 +1,39 @@
+# handoff.py
+import mmap, os, pickle, time
+
+# Быстрый перезапуск: при штатной остановке бот сбрасывает состояние из памяти
+# в один бинарный файл, новый процесс читает его через mmap вместо JSON/SQLite.
+MAGIC = b"RAIDBOT-HANDOFF-2\n"  # 2 — рейды как объекты Raid (raid_model.py)
+MAX_AGE = 300  # старше 5 минут — не доверяем, грузим из хранилища
+
+def dump_state(path, state):
+    """Пишем только после сброса хранилища: файл не может быть новее данных на диске"""
+    payload = pickle.dumps({"written_at": time.time(), "state": state}, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_state(path, max_age=MAX_AGE):
+    """Состояние из файла передачи или None. Файл одноразовый — удаляем сразу"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                return None
+            view = memoryview(mm)
+            try:
+                data = pickle.loads(view[len(MAGIC):])
+            finally:
+                view.release()  # иначе mmap не закроется
+    except Exception:
+        return None
+    finally:
+        os.remove(path)
+    if time.time() - data.get("written_at", 0) > max_age:
+        return None
+    return data["state"]
@@ -0,0 +1,86 @@
+# logs.py
+import atexit, copy, gzip, json, logging, os, queue, shutil, time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Логи бота и runner.py: вызовы logging только кладут запись в очередь, а в файл и
+# консоль её пишет фоновый поток — цикл событий на диске не блокируется.
+# Файл — JSON-строки, по достижении max_bytes он переименовывается и сжимается в
+# .gz (bot.log.1.gz, bot.log.2.gz, ...), старые архивы сверх backups удаляются.
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 10
+
+# поля, которые есть у любой записи; всё прочее пришло через extra= и идёт в JSON
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+class GzipRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler, который сжимает отложенные файлы"""
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = _gzip_rotator
+
+class _QueueHandler(QueueHandler):
+    """Текст сообщения собираем сразу (аргументы могут измениться), а traceback
+    оставляем как есть — очередь внутри процесса, JSON сам положит его в поле exc"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_listener = None
+
+def setup_logging(path, level=logging.INFO, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS, console=True):
+    """Один раз на процесс: корневой логгер -> очередь -> поток записи"""
+    global _listener
+    if _listener:
+        return _listener
+
+    file_handler = GzipRotatingFileHandler(path, max_bytes, backups)
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S"))
+        handlers.append(stream)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)  # дописываем очередь при выходе
+    return _listener
+
+def stop_logging():
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,159 @@
+# metrics.py
+import bisect, functools, logging, threading, time
+from contextlib import contextmanager
+
+# Метрики в текстовом формате Prometheus: http://127.0.0.1:<порт>/metrics
+# Обновляются из цикла событий, читаются из потока HTTP-сервера — поэтому под lock.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [(self.name, _labels(self.labels, key), value) for key, value in items]
+
+class Gauge:
+    """Значение берётся функцией в момент запроса /metrics"""
+    kind = "gauge"
+
+    def __init__(self, name, doc, fn):
+        self.name, self.doc, self.fn = name, doc, fn
+
+    def samples(self):
+        try:
+            return [(self.name, "", self.fn())]
+        except Exception:
+            return []
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # key -> [счётчики по корзинам..., сумма, количество]
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += seconds
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(row)) for key, row in self.values.items()]
+        out = []
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                out.append((f"{self.name}_bucket", _labels(self.labels + ("le",), key + (bound,)), cumulative))
+            out.append((f"{self.name}_bucket", _labels(self.labels + ("le",), key + ("+Inf",)), row[-1]))
+            out.append((f"{self.name}_sum", _labels(self.labels, key), row[-2]))
+            out.append((f"{self.name}_count", _labels(self.labels, key), row[-1]))
+        return out
+
+def timed(metric, **labels):
+    """Декоратор корутины: время выполнения в гистограмму"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with metric.time(**labels):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+registry = []
+
+def counter(name, doc, labels=()):
+    metric = Counter(name, doc, labels)
+    registry.append(metric)
+    return metric
+
+def gauge(name, doc, fn):
+    metric = Gauge(name, doc, fn)
+    registry.append(metric)
+    return metric
+
+def histogram(name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, doc, labels, buckets)
+    registry.append(metric)
+    return metric
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.doc}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+# ================== 429 ОТ DISCORD ==================
+class RateLimitCounter(logging.Handler):
+    """discord.py пишет о каждом 429 в логгер discord.http — считаем такие записи"""
+
+    def __init__(self, metric):
+        super().__init__(level=logging.WARNING)
+        self.metric = metric
+
+    def emit(self, record):
+        if "rate limited" in record.getMessage():
+            self.metric.inc()
+
+def count_rate_limits(metric):
+    logging.getLogger("discord.http").addHandler(RateLimitCounter(metric))
+
+# ================== HTTP ==================
+def start_http_server(host="127.0.0.1", port=9100):
+    """Flask в фоновом потоке, чтобы не трогать цикл событий бота"""
+    from flask import Flask, Response
+
+    app = Flask("metrics")
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
+
+    thread = threading.Thread(
+        target=app.run,
+        kwargs={"host": host, "port": port, "use_reloader": False, "threaded": True},
+        daemon=True,
+        name="metrics-http",
+    )
+    thread.start()
+    return thread
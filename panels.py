@@ -0,0 +1,62 @@
+# panels.py
+import asyncio
+from contextlib import asynccontextmanager
+import discord
+
+def can_bulk_delete(channel):
+    """Массовое удаление требует права «Управлять сообщениями»"""
+    guild = getattr(channel, "guild", None)
+    if guild is None or not hasattr(channel, "delete_messages"):
+        return False
+    return channel.permissions_for(guild.me).manage_messages
+
+class PanelManager:
+    """Работа с панелями во многих каналах сразу
+
+    Разные каналы обрабатываются параллельно, но не больше concurrency за раз. В
+    одном канале — строго по очереди: лимиты Discord на сообщения считаются по
+    каналу, а две одновременные пересылки панели оставили бы дубль. Сообщения,
+    которые бот удаляет сам, запоминаются по id на forget_after секунд — так
+    on_message_delete пропускает только их, а не все удаления на время прохода.
+    """
+
+    def __init__(self, concurrency=5, forget_after=60):
+        self.concurrency = concurrency
+        self.forget_after = forget_after
+        self.locks = {}        # channel_id -> asyncio.Lock
+        self.deleting = set()  # id сообщений, удаляемых ботом
+        self._semaphore = None
+
+    @asynccontextmanager
+    async def channel(self, channel_id):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        lock = self.locks.get(channel_id)
+        if lock is None:
+            lock = self.locks[channel_id] = asyncio.Lock()
+        async with lock, self._semaphore:
+            yield
+
+    def deleted_by_bot(self, message_id):
+        return message_id in self.deleting
+
+    def _mark(self, ids):
+        self.deleting.update(ids)
+        asyncio.get_running_loop().call_later(self.forget_after, self.deleting.difference_update, ids)
+
+    async def delete(self, channel, messages):
+        """Удаляем сообщения (Message или PartialMessage); несколько — одним запросом, если можно"""
+        if not messages:
+            return
+        self._mark([msg.id for msg in messages])
+        if len(messages) > 1 and can_bulk_delete(channel):
+            try:
+                await channel.delete_messages(messages)
+                return
+            except discord.HTTPException:
+                pass  # старше 14 дней или нет доступа — удаляем по одному
+        for msg in messages:
+            try:
+                await msg.delete()
+            except discord.HTTPException:
+                pass
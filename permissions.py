@@ -0,0 +1,72 @@
+# permissions.py
+import time
+from collections import OrderedDict
+
+# права участника
+CREATE_RAID = "create_raid"
+
+NO_CAPS = frozenset()
+ALL_CAPS = frozenset({CREATE_RAID})
+
+class PermissionResolver:
+    """Права участника с кэшем
+
+    Набор прав считается один раз на (guild_id, user_id) и лежит в LRU-кэше с TTL.
+    Роль РЛ ищется по имени один раз на сервер, дальше сравниваются только id.
+    Кэш сбрасывают события смены ролей участника и ролей сервера; TTL — страховка
+    на случай пропущенного события (переподключение к шлюзу).
+    """
+
+    def __init__(self, admin_id, rl_role_name, ttl=300, maxsize=10000):
+        self.admin_id = admin_id
+        self.rl_role_name = rl_role_name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.cache = OrderedDict()  # (guild_id, user_id) -> (истекает, права)
+        self.rl_roles = {}          # guild_id -> id роли РЛ или None
+
+    def rl_role_id(self, guild):
+        if guild.id not in self.rl_roles:
+            self.rl_roles[guild.id] = next(
+                (role.id for role in getattr(guild, "roles", ()) if role.name == self.rl_role_name), None)
+        return self.rl_roles[guild.id]
+
+    def _resolve(self, user, guild):
+        rl_id = self.rl_role_id(guild)
+        if rl_id is not None and any(role.id == rl_id for role in getattr(user, "roles", ())):
+            return ALL_CAPS
+        return NO_CAPS
+
+    def capabilities(self, user, guild):
+        if user.id == self.admin_id:
+            return ALL_CAPS
+        if guild is None:
+            return NO_CAPS  # в личке ролей нет
+        key = (guild.id, user.id)
+        now = time.monotonic()
+        entry = self.cache.get(key)
+        if entry and entry[0] > now:
+            self.cache.move_to_end(key)
+            return entry[1]
+        caps = self._resolve(user, guild)
+        self.cache[key] = (now + self.ttl, caps)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return caps
+
+    def can(self, user, guild, capability):
+        return capability in self.capabilities(user, guild)
+
+    def forget_member(self, guild_id, user_id):
+        self.cache.pop((guild_id, user_id), None)
+
+    def forget_guild(self, guild_id):
+        """Роли сервера поменялись — заново ищем РЛ и пересчитываем всех его участников"""
+        self.rl_roles.pop(guild_id, None)
+        for key in [key for key in self.cache if key[0] == guild_id]:
+            del self.cache[key]
+
+    def clear(self):
+        self.cache.clear()
+        self.rl_roles.clear()
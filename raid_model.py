@@ -0,0 +1,193 @@
+# raid_model.py
+import asyncio, sys, time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+# результаты claim()
+CLAIMED = "claimed"
+BAD_SLOT = "bad_slot"
+SLOT_TAKEN = "slot_taken"
+ALREADY_SIGNED = "already_signed"
+
+# ================== ДАННЫЕ РЕЙДА ==================
+# Рейдов в памяти много, а runner.py перезапускает бота на 450 МБ, поэтому рейд и
+# слот — классы с __slots__ вместо словарей. Роли интернируются (сотни «ДД» — одна
+# строка), участник хранится как int id; имя берётся из NameCache при отрисовке.
+# В JSON-хранилище и SQLite лежит прежняя форма словаря (to_dict / from_dict).
+
+class Slot:
+    __slots__ = ("role", "user")
+
+    def __init__(self, role, user=None):
+        self.role = sys.intern(role)
+        self.user = user  # id участника; строка — отображаемое имя из старых данных
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("role", ""), data.get("user"))
+
+    def to_dict(self):
+        return {"role": self.role, "user": self.user}
+
+class Raid:
+    __slots__ = ("name", "desc", "time", "author_id", "author_name", "slots",
+                 "created_at", "channel_id", "guild_id")
+
+    def __init__(self, name, desc, time, author_id, author_name, slots,
+                 created_at, channel_id, guild_id=None):
+        self.name = name
+        self.desc = desc
+        self.time = time
+        self.author_id = author_id
+        self.author_name = author_name
+        self.slots = slots
+        self.created_at = created_at
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data.get("name", ""),
+            data.get("desc", ""),
+            data.get("time", ""),
+            data.get("author_id"),
+            data.get("author_name", ""),
+            [Slot.from_dict(slot) for slot in data.get("slots", [])],
+            data.get("created_at", time.time()),
+            data.get("channel_id"),
+            data.get("guild_id"),
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "desc": self.desc,
+            "time": self.time,
+            "author_id": self.author_id,
+            "author_name": self.author_name,
+            "slots": [slot.to_dict() for slot in self.slots],
+            "created_at": self.created_at,
+            "channel_id": self.channel_id,
+            "guild_id": self.guild_id,
+        }
+
+class NameCache:
+    """Отображаемые имена участников по id, не больше maxsize (вытесняем давно не нужные)"""
+
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self.names = OrderedDict()
+
+    def remember(self, user_id, name):
+        self.names[user_id] = name
+        self.names.move_to_end(user_id)
+        if len(self.names) > self.maxsize:
+            self.names.popitem(last=False)
+
+    def resolve(self, user_id, guild=None):
+        """Имя из кэша, иначе из кэша участников сервера; None — не знаем"""
+        name = self.names.get(user_id)
+        if name is not None:
+            self.names.move_to_end(user_id)
+            return name
+        member = guild.get_member(user_id) if guild else None
+        if member is None:
+            return None
+        self.remember(user_id, member.display_name)
+        return member.display_name
+
+# ================== ЗАПИСЬ В СЛОТЫ ==================
+class SlotBook:
+    """Запись в слоты рейдов без гонок
+
+    Проверка и занятие слота делаются одним синхронным шагом (без await между ними),
+    а индекс {участник: номер слота} на каждый рейд делает проверку «уже записан» O(1).
+    Рядом — отсортированный список свободных слотов для меню выбора под рейдом.
+    Оба индекса строятся лениво из raid.slots и дальше поддерживаются claim/release.
+    Версия рейда растёт при каждом изменении состава — по ней кэшируется embed.
+    """
+
+    def __init__(self):
+        self.locks = {}       # raid_id -> asyncio.Lock
+        self.user_slots = {}  # raid_id -> {id участника: индекс слота}
+        self.free = {}        # raid_id -> [индексы свободных слотов по возрастанию]
+        self.versions = {}    # raid_id -> номер версии состава
+
+    def lock(self, raid_id):
+        """Блокировка для многошаговых операций над одним рейдом"""
+        lock = self.locks.get(raid_id)
+        if lock is None:
+            lock = self.locks[raid_id] = asyncio.Lock()
+        return lock
+
+    def version(self, raid_id):
+        return self.versions.get(raid_id, 0)
+
+    def _bump(self, raid_id):
+        self.versions[raid_id] = self.versions.get(raid_id, 0) + 1
+
+    def _index(self, raid_id, raid):
+        index = self.user_slots.get(raid_id)
+        if index is None:
+            index = {slot.user: i for i, slot in enumerate(raid.slots) if slot.user}
+            self.user_slots[raid_id] = index
+        return index
+
+    def _free(self, raid_id, raid):
+        free = self.free.get(raid_id)
+        if free is None:
+            free = self.free[raid_id] = [i for i, slot in enumerate(raid.slots) if not slot.user]
+        return free
+
+    def free_slots(self, raid_id, raid):
+        """Индексы (с 0) свободных слотов по возрастанию; список не менять"""
+        return self._free(raid_id, raid)
+
+    def user_slot(self, raid_id, raid, user):
+        """Номер слота (с 1), который занимает участник, или None"""
+        i = self._index(raid_id, raid).get(user)
+        return None if i is None else i + 1
+
+    def claim(self, raid_id, raid, num, user):
+        """Атомарно занимаем слот num (с 1) за участником"""
+        if num < 1 or num > len(raid.slots):
+            return BAD_SLOT
+        index = self._index(raid_id, raid)
+        if user in index:
+            return ALREADY_SIGNED
+        slot = raid.slots[num-1]
+        if slot.user:
+            return SLOT_TAKEN
+        free = self._free(raid_id, raid)
+        slot.user = user
+        index[user] = num - 1
+        del free[bisect_left(free, num - 1)]
+        self._bump(raid_id)
+        return CLAIMED
+
+    def release(self, raid_id, raid, num):
+        """Освобождаем слот num (с 1); возвращаем, кто в нём был"""
+        if num < 1 or num > len(raid.slots):
+            return None
+        slot = raid.slots[num-1]
+        if not slot.user:
+            return None
+        free = self._free(raid_id, raid)
+        user, slot.user = slot.user, None
+        self._index(raid_id, raid).pop(user, None)
+        insort(free, num - 1)
+        self._bump(raid_id)
+        return user
+
+    def forget(self, raid_id):
+        self.locks.pop(raid_id, None)
+        self.user_slots.pop(raid_id, None)
+        self.free.pop(raid_id, None)
+        self.versions.pop(raid_id, None)
+
+    def clear(self):
+        self.locks.clear()
+        self.user_slots.clear()
+        self.free.clear()
+        self.versions.clear()
@@ -0,0 +1,101 @@
+# render.py
+import discord
+
+# лимиты Discord на embed
+DESC_LIMIT = 4096
+FIELD_LIMIT = 1024
+MAX_FIELDS = 25
+EMBED_TOTAL = 6000
+HEADER_LIMIT = 2000  # описание рейда не должно съедать место под состав
+LINE_LIMIT = 200     # одна строка слота
+FIELD_NAME = "Участники (продолжение)"
+FOOTER_RESERVE = 40  # место под «не показано слотов: N»
+
+def _take(lines, start, room):
+    """Берём строки начиная с start, пока влезают в room символов"""
+    end, size = start, 0
+    while end < len(lines) and size + len(lines[end]) <= room:
+        size += len(lines[end])
+        end += 1
+    return "".join(lines[start:end]), end
+
+class RaidRenderer:
+    """Сборка embed рейда с кэшем
+
+    Кэш по raid_id хранит версию рейда (меняется при записи/отписке), готовый embed
+    и строки слотов. Та же версия — отдаём готовый embed; новая — пересобираем,
+    переиспользуя строки слотов, которые не поменялись. Состав, не влезающий в
+    описание (4096), переносится в поля, остальное отсекается по лимиту 6000.
+    """
+
+    def __init__(self, name_of=None):
+        self.name_of = name_of  # name_of(raid, user_id) -> как показать участника
+        self.cache = {}  # raid_id -> (version, finished, embed, keys, lines)
+
+    def forget(self, raid_id):
+        self.cache.pop(raid_id, None)
+
+    def clear(self):
+        self.cache.clear()
+
+    def render(self, raid_id, raid, version=0, finished=False):
+        cached = self.cache.get(raid_id) if raid_id else None
+        if cached and cached[0] == version and cached[1] == finished:
+            return cached[2].copy()
+
+        old_keys, old_lines = (cached[3], cached[4]) if cached else ((), ())
+        keys, lines = [], []
+        for i, slot in enumerate(raid.slots):
+            key = (slot.role, slot.user)
+            if i < len(old_keys) and old_keys[i] == key:
+                line = old_lines[i]
+            else:
+                line = f"{i+1} {slot.role}: {self.user_text(raid, slot.user)}"[:LINE_LIMIT] + "\n"
+            keys.append(key)
+            lines.append(line)
+
+        embed = self._build(raid, lines, finished)
+        if raid_id:
+            self.cache[raid_id] = (version, finished, embed, keys, lines)
+        return embed.copy()
+
+    def user_text(self, raid, user):
+        if not user:
+            return "—"
+        if isinstance(user, str) or not self.name_of:
+            return str(user)  # старые данные хранили имя
+        return self.name_of(raid, user)
+
+    def _build(self, raid, lines, finished):
+        title = f"⚔️ {raid.name}"[:256]
+        if finished:
+            title = title[:240] + " [Завершён]"
+        header = f"**Описание:** {raid.desc}\n**Время:** {raid.time}"[:HEADER_LIMIT] + "\n\n**Участники:**\n"
+        if finished:  # в шапке, а не после состава — длинный состав отсекается с конца
+            header = "⚠️ **Рейд завершён**\n\n" + header
+        footer = f"Создано: {raid.author_name}"[:200]
+
+        remaining = EMBED_TOTAL - len(title) - len(footer) - FOOTER_RESERVE
+        body, pos = _take(lines, 0, min(DESC_LIMIT, remaining) - len(header))
+        desc = header + body
+        remaining -= len(desc)
+
+        embed = discord.Embed(
+            title=title,
+            description=desc,
+            color=discord.Color.light_grey() if finished else discord.Color.orange()
+        )
+        fields = 0
+        while pos < len(lines) and fields < MAX_FIELDS:
+            value, end = _take(lines, pos, min(FIELD_LIMIT, remaining - len(FIELD_NAME)))
+            if end == pos:
+                break
+            embed.add_field(name=FIELD_NAME, value=value, inline=False)
+            remaining -= len(FIELD_NAME) + len(value)
+            pos = end
+            fields += 1
+
+        if pos < len(lines):
+            footer += f" · не показано слотов: {len(lines) - pos}"
+        embed.set_footer(text=footer)
+        return embed
@@ -1,31 +1,35 @@
 import os
+import sys
 import time
+import signal
 import psutil
 import subprocess
-import traceback
 import requests
 import logging
 import gc
+import threading
+from logs import setup_logging
+from collections import deque
 
 # ---------------------- Настройки ----------------------
 BOT_FILE = "bot.py"          # твой бот
-RESTART_DELAY = 10           # пауза перед перезапуском
+RESTART_DELAY = 10           # первая пауза перед перезапуском
+MAX_RESTART_DELAY = 300      # потолок паузы при падениях подряд
+STABLE_UPTIME = 600          # столько проработал — пауза сбрасывается
 MEMORY_LIMIT_MB = 450        # лимит памяти
 CPU_LIMIT = 90               # лимит CPU %
 CHECK_INTERVAL = 5           # проверка каждые N секунд
-LOG_FILE = "bot.log"         # лог-файл
+SAMPLE_WINDOW = 12           # усредняем по 12 замерам (~1 минута)
+STOP_TIMEOUT = 20            # сколько ждём мягкой остановки до SIGKILL
+LOG_FILE = "runner.log"      # лог-файл супервизора (бот пишет свой bot.log)
 KEEPALIVE_INTERVAL = 300     # 5 минут ping самому себе
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))  # 0 — один процесс без шардов
+WORKERS = int(os.getenv("WORKERS", "1"))          # процессов бота при шардах
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
 
-# Настройка логов
-logging.basicConfig(
-    level=logging.INFO,
-    format="[%(asctime)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логов: JSON-строки с ротацией и сжатием (см. logs.py)
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+setup_logging(LOG_FILE)
 
 # ---------------------- Функции ----------------------
 def ping_self():
@@ -36,69 +40,158 @@ def ping_self():
     except:
         pass
 
-def monitor_process(process):
-    """Следим за процессом бота"""
-    try:
-        ps_proc = psutil.Process(process.pid)
-    except psutil.NoSuchProcess:
-        return False
-
-    while True:
-        time.sleep(CHECK_INTERVAL)
-        if process.poll() is not None:
-            logging.warning("⚠️ Процесс завершён")
-            return False
+class Supervisor:
+    """Следим за процессом бота
+
+    Один psutil.Process на запуск, CPU меряется без блокировки (между проверками),
+    решение о перезапуске — по среднему за окно, а не по единичному всплеску.
+    Останавливаем мягко (SIGTERM — бот сохраняет данные), SIGKILL только по таймауту.
+    Падения подряд разводятся экспоненциальной паузой; перезапуск по перегрузке
+    её не растит.
+    """
+
+    def __init__(self, cmd, env=None, name="бот"):
+        self.cmd = cmd
+        self.env = env
+        self.name = name
+        self.process = None
+        self.ps_proc = None
+        self.mem = deque(maxlen=SAMPLE_WINDOW)
+        self.cpu = deque(maxlen=SAMPLE_WINDOW)
+        self.delay = RESTART_DELAY
+        self.last_ping = 0
+        self.stopping = False
+        self.stop_event = threading.Event()  # будит паузу перед перезапуском по сигналу
+
+    def start(self):
+        logging.info(f"🚀 Запуск: {self.name}")
+        self.process = subprocess.Popen(self.cmd, env=self.env)
+        self.mem.clear()
+        self.cpu.clear()
         try:
-            mem = ps_proc.memory_info().rss / (1024 * 1024)  # MB
-            cpu = ps_proc.cpu_percent(interval=1)            # % CPU
-            if mem > MEMORY_LIMIT_MB:
-                logging.warning(f"⚠️ Процесс использует слишком много памяти: {mem:.2f} MB")
-                process.kill()
-                return False
-            if cpu > CPU_LIMIT:
-                logging.warning(f"⚠️ CPU перегружен: {cpu:.2f}%")
-                process.kill()
-                return False
+            self.ps_proc = psutil.Process(self.process.pid)
+            self.ps_proc.cpu_percent(interval=None)  # первый вызов только запоминает точку отсчёта
         except psutil.NoSuchProcess:
-            logging.warning("⚠️ Процесс завершён")
-            return False
-        except Exception:
-            logging.error(f"❌ Ошибка мониторинга:\n{traceback.format_exc()}")
-            return False
+            self.ps_proc = None
+
+    def sample(self):
+        self.mem.append(self.ps_proc.memory_info().rss / (1024 * 1024))  # MB
+        self.cpu.append(self.ps_proc.cpu_percent(interval=None))         # % CPU с прошлого замера
+
+    def overload(self):
+        """Причина перезапуска, если средние за полное окно выше лимитов"""
+        if len(self.mem) < SAMPLE_WINDOW:
+            return None
+        mem = sum(self.mem) / len(self.mem)
+        cpu = sum(self.cpu) / len(self.cpu)
+        if mem > MEMORY_LIMIT_MB:
+            return f"mem={mem:.2f}MB (среднее за окно)"
+        if cpu > CPU_LIMIT:
+            return f"cpu={cpu:.2f}% (среднее за окно)"
+        return None
+
+    def stop(self):
+        """SIGTERM → ждём, пока бот сбросит данные → SIGKILL"""
+        if self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logging.warning(f"⚠️ Бот не остановился за {STOP_TIMEOUT} с — SIGKILL")
+            self.process.kill()
+            self.process.wait()
+
+    def watch(self):
+        """Ждём завершения процесса или перегрузки; заодно пингуем VPS
+
+        Возвращает причину перегрузки, если остановили мы сами, иначе None.
+        """
+        while not self.stopping:
+            if time.time() - self.last_ping > KEEPALIVE_INTERVAL:
+                ping_self()
+                self.last_ping = time.time()
+
+            try:
+                code = self.process.wait(timeout=CHECK_INTERVAL)  # просыпаемся сразу при выходе
+                logging.warning(f"⚠️ Процесс завершён: {self.name} (код {code})")
+                return None
+            except subprocess.TimeoutExpired:
+                pass
+
+            if self.ps_proc is None:
+                continue
+            try:
+                self.sample()
+            except psutil.NoSuchProcess:
+                continue  # процесс уже вышел — wait() заметит
+            reason = self.overload()
+            if reason:
+                logging.warning(f"⚠️ Перезапуск {self.name}: {reason}")
+                self.stop()
+                return reason
+        return None
+
+    def handle_signal(self, signum, frame):
+        logging.info("🛑 Супервизор останавливается")
+        self.stopping = True
+        self.stop_event.set()
+
+    def run_forever(self):
+        while not self.stopping:
+            started = time.time()
+            overloaded = None
+            try:
+                self.start()
+                overloaded = self.watch()
+            except Exception:
+                logging.exception("❌ Ошибка в основном цикле")
+            if self.process:
+                self.stop()
+            if self.stopping:
+                break
+
+            # падает сразу после старта — удваиваем паузу; проработал долго или
+            # перезапущен нами по перегрузке — сбрасываем
+            if overloaded or time.time() - started >= STABLE_UPTIME:
+                self.delay = RESTART_DELAY
+            logging.info(f"♻️ Перезапуск {self.name} через {self.delay} секунд...")
+            if self.stop_event.wait(self.delay):
+                break  # SIGTERM во время паузы — выходим сразу
+            self.delay = RESTART_DELAY if overloaded else min(self.delay * 2, MAX_RESTART_DELAY)
+            gc.collect()
+
+def shard_workers():
+    """Делим SHARD_COUNT шардов на WORKERS процессов подряд идущими диапазонами"""
+    workers = []
+    count = min(WORKERS, SHARD_COUNT)
+    for i in range(count):
+        shard_ids = list(range(i * SHARD_COUNT // count, (i + 1) * SHARD_COUNT // count))
+        env = dict(os.environ,
+                   STORAGE_BACKEND="sqlite",  # общее хранилище для всех процессов
+                   SHARD_IDS=",".join(map(str, shard_ids)),
+                   METRICS_PORT=str(METRICS_PORT + i if METRICS_PORT else 0))
+        workers.append(Supervisor(["python3", BOT_FILE], env=env, name=f"воркер {i} (шарды {shard_ids[0]}-{shard_ids[-1]})"))
+    return workers
 
 # ---------------------- Основной цикл ----------------------
 if __name__ == "__main__":
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    last_ping = 0
+    if SHARD_COUNT and WORKERS > 1:
+        supervisors = shard_workers()
+    else:
+        supervisors = [Supervisor(["python3", BOT_FILE])]
 
-    while True:
-        try:
-            logging.info("🚀 Запуск бота")
-            process = subprocess.Popen(["python3", BOT_FILE])
-
-            while True:
-                # Пинг VPS каждые KEEPALIVE_INTERVAL секунд
-                if time.time() - last_ping > KEEPALIVE_INTERVAL:
-                    ping_self()
-                    last_ping = time.time()
-
-                # Проверяем процесс
-                if process.poll() is not None:
-                    logging.warning("⚠️ Процесс бота завершён")
-                    break
-
-                mem = psutil.Process(process.pid).memory_info().rss / (1024*1024)
-                cpu = psutil.Process(process.pid).cpu_percent(interval=1)
-                if mem > MEMORY_LIMIT_MB or cpu > CPU_LIMIT:
-                    logging.warning(f"⚠️ Перезапуск: mem={mem:.2f}MB cpu={cpu:.2f}%")
-                    process.kill()
-                    break
-
-                time.sleep(CHECK_INTERVAL)
-
-        except Exception:
-            logging.error(f"❌ Ошибка в основном цикле:\n{traceback.format_exc()}")
-
-        logging.info(f"♻️ Перезапуск бота через {RESTART_DELAY} секунд...")
-        time.sleep(RESTART_DELAY)
-        gc.collect()
+    def stop_all(signum, frame):
+        for supervisor in supervisors:
+            supervisor.handle_signal(signum, frame)
+    signal.signal(signal.SIGTERM, stop_all)
+    signal.signal(signal.SIGINT, stop_all)
+
+    # у каждого воркера свой поток-надзиратель, перезапуски независимы
+    threads = [threading.Thread(target=s.run_forever, name=s.name) for s in supervisors]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1)  # join с таймаутом, чтобы сигналы доходили до главного потока
+    sys.exit(0)
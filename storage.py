@@ -0,0 +1,458 @@
+# storage.py
+import json, os, sys, time, asyncio, sqlite3, logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+log = logging.getLogger(__name__)
+
+# сколько записали на диск (для метрик и нагрузочных тестов)
+stats = {"bytes_written": 0, "fsyncs": 0}
+
+def _write_synced(f, text):
+    f.write(text)
+    f.flush()
+    os.fsync(f.fileno())
+    stats["bytes_written"] += len(text.encode("utf-8"))
+    stats["fsyncs"] += 1
+
+# ================== АТОМАРНАЯ ЗАПИСЬ ==================
+def atomic_write(path, text):
+    """Пишем во временный файл и подменяем оригинал — обрыв не оставит обрезанный файл"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        _write_synced(f, text)
+    os.replace(tmp, path)
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except:
+        return default
+
+def plain(obj):
+    """Объекты с to_dict() (Raid, Slot) в JSON-форму; json.dumps зовёт это для незнакомых типов"""
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if isinstance(obj, dict):
+        return obj
+    raise TypeError(f"{type(obj).__name__} не сериализуется в JSON")
+
+def dump_json(data):
+    return json.dumps(data, indent=4, ensure_ascii=False, default=plain)
+
+def save_json(path, data):
+    atomic_write(path, dump_json(data))
+
+# ================== ЖУРНАЛ ИЗМЕНЕНИЙ ==================
+class JournalStore:
+    """Снимок словаря в JSON + журнал мутаций (одна строка на изменение)
+
+    put/delete только копят строки в памяти — на диск их пишет PersistenceWorker
+    пачкой с одним fsync. Записи журнала идемпотентны (set/del), поэтому повторное
+    применение журнала поверх более свежего снимка даёт то же состояние.
+    """
+
+    def __init__(self, path, compact_after=500):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.compact_after = compact_after  # сколько записей копим до сжатия
+        self.records = 0
+        self.pending = []
+
+    def load(self):
+        data = load_json(self.path, {})
+        if not isinstance(data, dict):
+            data = {}
+        self.records = self._replay(data)
+        self._cut_torn_tail()
+        return data
+
+    def count_records(self):
+        """Записи журнала на диске — без разбора, когда данные уже есть в памяти"""
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, "rb") as f:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 16), b""))
+
+    def _cut_torn_tail(self):
+        """Обрезаем недописанную последнюю строку — иначе следующая запись приклеится к ней"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb+") as f:
+            data = f.read()
+            if not data or data.endswith(b"\n"):
+                return
+            f.truncate(data.rfind(b"\n") + 1)
+            f.flush()
+            os.fsync(f.fileno())
+        log.warning(f"⚠️ Журнал {self.journal_path}: отброшен недописанный хвост")
+
+    def _replay(self, data):
+        if not os.path.exists(self.journal_path):
+            return 0
+        count = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # недописанная строка после падения
+                if rec.get("op") == "set":
+                    data[rec["k"]] = rec["v"]
+                elif rec.get("op") == "del":
+                    data.pop(rec["k"], None)
+                count += 1
+        return count
+
+    def _append(self, rec):
+        # сериализуем сразу — к моменту записи словарь рейда может измениться
+        self.pending.append(json.dumps(rec, ensure_ascii=False, separators=(",", ":"), default=plain) + "\n")
+        self.records += 1
+
+    def put(self, key, value):
+        self._append({"op": "set", "k": key, "v": value})
+
+    def delete(self, key):
+        self._append({"op": "del", "k": key})
+
+    def _write_lines(self, lines):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            _write_synced(f, "".join(lines))
+
+    def flush_job(self):
+        """Забираем накопленные строки; возвращаем блокирующую запись или None"""
+        if not self.pending:
+            return None
+        lines, self.pending = self.pending, []
+        return lambda: self._write_lines(lines)
+
+    def needs_compaction(self):
+        return self.records >= self.compact_after
+
+    def compaction_job(self, data):
+        """Снимок сериализуем сейчас (в цикле событий), пишем — в потоке записи"""
+        lines, self.pending = self.pending, []
+        text = dump_json(data)
+        self.records = 0
+
+        def job():
+            # сначала дописываем журнал: падение между шагами не откатит состояние
+            if lines:
+                self._write_lines(lines)
+            atomic_write(self.path, text)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        return job
+
+# ================== ХРАНИЛИЩА ==================
+# Оба хранилища копят изменения в памяти; flush_job() отдаёт блокирующую запись
+# для PersistenceWorker.
+
+class JsonBackend:
+    """Хранилище по умолчанию: raids.json + журнал, остальное — отдельные JSON-файлы"""
+
+    def __init__(self, raids_path="raids.json", channels_path="channel.json",
+                 panels_path="panels.json", blocks_path="blocks.json"):
+        self.raids_journal = JournalStore(raids_path)
+        self.paths = {"channels": channels_path, "panels": panels_path, "blocks": blocks_path}
+        self.raids = {}
+        self.pending_files = {}  # путь -> готовый текст файла
+        self.reset_raids = False
+
+    def load_raids(self, shard_count=0, shard_ids=None):
+        # JSON не делится между процессами — все шарды у одного, отдаём всё
+        self.raids = self.raids_journal.load()
+        return self.raids
+
+    def use_raids(self, raids):
+        """Рейды уже в памяти (быстрый перезапуск) — нужны для сжатия"""
+        self.raids = raids
+        # журнал прошлого процесса тоже в счёт, иначе частые перезапуски его не сожмут
+        self.raids_journal._cut_torn_tail()
+        self.raids_journal.records = self.raids_journal.count_records() + len(self.raids_journal.pending)
+
+    def _load(self, name, default):
+        data = load_json(self.paths[name], default)
+        return data if isinstance(data, type(default)) else default
+
+    def load_channels(self):
+        return self._load("channels", [])
+
+    def load_panels(self):
+        return self._load("panels", {})
+
+    def load_blocks(self):
+        return self._load("blocks", {})
+
+    def put_raid(self, raid_id, raid):
+        self.raids_journal.put(raid_id, raid)
+
+    def delete_raid(self, raid_id):
+        self.raids_journal.delete(raid_id)
+
+    def clear_raids(self):
+        self.raids_journal.pending = []
+        self.reset_raids = True
+
+    def _save(self, name, data):
+        self.pending_files[self.paths[name]] = dump_json(data)
+
+    def save_channels(self, channels):
+        self._save("channels", channels)
+
+    def save_panels(self, panels):
+        self._save("panels", panels)
+
+    def save_blocks(self, blocks):
+        self._save("blocks", blocks)
+
+    def flush_job(self):
+        files, self.pending_files = self.pending_files, {}
+        reset, self.reset_raids = self.reset_raids, False
+        journal_job = self.raids_journal.compaction_job({}) if reset else None
+        lines_job = self.raids_journal.flush_job()
+        if not (files or journal_job or lines_job):
+            return None
+
+        def job():
+            for path, text in files.items():
+                atomic_write(path, text)
+            if journal_job:
+                journal_job()
+            if lines_job:
+                lines_job()
+        return job
+
+    def needs_compaction(self):
+        return self.raids_journal.needs_compaction()
+
+    def compaction_job(self):
+        return self.raids_journal.compaction_job(self.raids)
+
+    def close(self):
+        pass
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS raids (
+    id TEXT PRIMARY KEY,
+    channel_id INTEGER,
+    created_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS raids_created_at ON raids(created_at);
+CREATE INDEX IF NOT EXISTS raids_channel_id ON raids(channel_id);
+CREATE TABLE IF NOT EXISTS channels (channel_id INTEGER PRIMARY KEY, pos INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS panels (channel_id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS blocks (channel_id INTEGER PRIMARY KEY, until REAL NOT NULL);
+"""
+
+class SqliteBackend:
+    """SQLite в режиме WAL: рейд — строка таблицы, запись одной транзакцией на пачку
+
+    Файл базы могут делить несколько процессов (шарды), поэтому каналы, панели и
+    блокировки пишутся построчно — только то, что изменилось в этом процессе, а
+    воркер при старте читает только рейды своих шардов (по столбцу guild_id).
+    """
+
+    def __init__(self, path="bot.db"):
+        self.path = path
+        # соединением пользуется поток записи, поэтому check_same_thread=False;
+        # timeout — подождать, если в базу сейчас пишет другой процесс
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self._add_guild_column()
+        self.pending = []  # [(sql, params)] в порядке изменений
+        self.synced = {}   # таблица -> {channel_id: значение}, как её видит этот процесс
+
+    def _add_guild_column(self):
+        """База от старой версии: добавляем guild_id и заполняем его из JSON рейда"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(raids)")}
+        if "guild_id" not in columns:
+            try:
+                with self.conn:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    self.conn.execute("ALTER TABLE raids ADD COLUMN guild_id INTEGER")
+                    self.conn.execute("UPDATE raids SET guild_id = json_extract(data, '$.guild_id')")
+            except sqlite3.OperationalError:
+                pass  # столбец только что добавил другой воркер
+        self.conn.execute("CREATE INDEX IF NOT EXISTS raids_guild_id ON raids(guild_id)")
+
+    def load_raids(self, shard_count=0, shard_ids=None):
+        """Рейды своих шардов; старые без guild_id отдаём всем — владельца решит бот"""
+        sql, params = "SELECT id, data FROM raids", ()
+        if shard_count and shard_ids:
+            marks = ",".join("?" * len(shard_ids))
+            # свои строки выбираем по индексу guild_id, страницы с данными читаем только для них
+            sql += f" WHERE rowid IN (SELECT rowid FROM raids WHERE guild_id IS NULL OR (guild_id >> 22) % ? IN ({marks}))"
+            params = (shard_count, *shard_ids)
+        return {rid: json.loads(data) for rid, data in self.conn.execute(sql, params)}
+
+    def use_raids(self, raids):
+        pass
+
+    def _load_rows(self, table, column):
+        rows = dict(self.conn.execute(f"SELECT channel_id, {column} FROM {table}"))
+        self.synced[table] = dict(rows)
+        return rows
+
+    def _save_rows(self, table, rows):
+        known = self.synced.get(table, {})
+        for ch, value in rows.items():
+            if known.get(ch) != value:
+                self.pending.append((f"INSERT OR REPLACE INTO {table} VALUES (?, ?)", (ch, value)))
+        for ch in known.keys() - rows.keys():
+            self.pending.append((f"DELETE FROM {table} WHERE channel_id = ?", (ch,)))
+        self.synced[table] = dict(rows)
+
+    def load_channels(self):
+        rows = self._load_rows("channels", "pos")
+        return sorted(rows, key=rows.get)
+
+    def load_panels(self):
+        return {str(ch): msg for ch, msg in self._load_rows("panels", "message_id").items()}
+
+    def load_blocks(self):
+        return self._load_rows("blocks", "until")
+
+    def put_raid(self, raid_id, raid):
+        data = plain(raid)
+        self.pending.append((
+            "INSERT OR REPLACE INTO raids (id, channel_id, guild_id, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (raid_id, data.get("channel_id"), data.get("guild_id"), data.get("created_at"),
+             json.dumps(data, ensure_ascii=False, separators=(",", ":"))),
+        ))
+
+    def delete_raid(self, raid_id):
+        self.pending.append(("DELETE FROM raids WHERE id = ?", (raid_id,)))
+
+    def clear_raids(self):
+        self.pending.append(("DELETE FROM raids", ()))
+
+    def save_channels(self, channels):
+        self._save_rows("channels", {ch: pos for pos, ch in enumerate(channels)})
+
+    def save_panels(self, panels):
+        self._save_rows("panels", {int(ch): msg for ch, msg in panels.items()})
+
+    def save_blocks(self, blocks):
+        self._save_rows("blocks", {int(ch): until for ch, until in blocks.items()})
+
+    def flush_job(self):
+        if not self.pending:
+            return None
+        ops, self.pending = self.pending, []
+
+        def job():
+            with self.conn:  # одна транзакция на пачку
+                self.conn.execute("BEGIN")
+                for sql, params in ops:
+                    self.conn.execute(sql, params)
+        return job
+
+    def needs_compaction(self):
+        return True
+
+    def compaction_job(self):
+        return lambda: self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        self.conn.close()
+
+def open_backend(kind, **paths):
+    if kind == "sqlite":
+        return SqliteBackend(paths.get("db_path", "bot.db"))
+    return JsonBackend(**{k: v for k, v in paths.items() if k != "db_path"})
+
+def migrate_json_to_sqlite(json_backend, sqlite_backend):
+    """Разовый перенос данных из JSON-файлов в SQLite"""
+    for raid_id, raid in json_backend.load_raids().items():
+        sqlite_backend.put_raid(raid_id, raid)
+    sqlite_backend.save_channels(json_backend.load_channels())
+    sqlite_backend.save_panels(json_backend.load_panels())
+    sqlite_backend.save_blocks(json_backend.load_blocks())
+    job = sqlite_backend.flush_job()
+    if job:
+        job()
+
+# ================== ФОНОВАЯ ЗАПИСЬ ==================
+class PersistenceWorker:
+    """Копит «грязные» ключи за короткое окно и пишет их одним заходом в отдельном потоке
+
+    mark_dirty(key, prepare): prepare вызывается в цикле событий в момент записи
+    (берёт самое свежее состояние) и возвращает блокирующую функцию или None.
+    Все операции с файлами идут через один поток — порядок записи сохраняется.
+    """
+
+    def __init__(self, window=0.25, observe=None):
+        self.window = window
+        self.observe = observe  # observe(секунды) после каждой пачки — для метрик
+        self.dirty = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self._wake = None
+        self._task = None
+
+    def start(self):
+        self._wake = asyncio.Event()
+        if self.dirty:
+            self._wake.set()
+        self._task = asyncio.create_task(self._run())
+
+    def mark_dirty(self, key, prepare):
+        self.dirty[key] = prepare
+        if self._wake:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.window)  # даём пачке кликов накопиться
+            self._wake.clear()
+            await self.flush()
+
+    async def run(self, fn, *args):
+        """Разовая блокирующая операция в очереди потока записи"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args))
+
+    async def flush(self):
+        dirty, self.dirty = self.dirty, {}
+        jobs = [job for job in (prepare() for prepare in dirty.values()) if job]
+        if jobs:
+            start = time.perf_counter()
+            await self.run(_run_jobs, jobs)
+            if self.observe:
+                self.observe(time.perf_counter() - start)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        # отменённая пачка могла ещё писаться в потоке — поток один, так что пустая
+        # задача за ней дождётся её конца, и только потом хранилище можно закрывать
+        await self.run(lambda: None)
+
+def _run_jobs(jobs):
+    for job in jobs:
+        try:
+            job()
+        except Exception:
+            log.exception("❌ Ошибка записи на диск")
+
+# ================== МИГРАЦИЯ ==================
+# python storage.py migrate [bot.db]
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Использование: python storage.py migrate [bot.db]")
+        sys.exit(1)
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "bot.db"
+    target = SqliteBackend(db_path)
+    migrate_json_to_sqlite(JsonBackend(), target)
+    count = target.conn.execute("SELECT COUNT(*) FROM raids").fetchone()[0]
+    target.close()
+    print(f"✅ Перенесено в {db_path}: рейдов {count}")